@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the SniperBowlBot hot paths.
+
+Drives the real handlers in bot.py against local stand-ins:
+  * a stub HTTP server answering the Moralis, CoinGecko, Jupiter and
+    DexScreener routes the bot uses, with injectable latency, an optional
+    rate limit (429s) and providers that can be taken down (--down),
+  * an in-memory replacement for the Mongo collections,
+  * optionally (--tracked) a websocket stand-in for a Solana RPC node that
+    the wallet tracker subscribes to, with a share of wallets trading
+    between runs,
+  * fake Telegram updates for a synthetic chat of N wallets x M tokens and
+    N picks.
+
+For every scenario it reports latency percentiles, provider calls per run
+and peak traced memory. Use --json to keep results across commits.
+
+    python bench.py --wallets 100 --tokens 30 --latency-ms 80
+"""
+import os
+import sys
+import json
+import time
+import random
+import functools
+import itertools
+import asyncio
+import argparse
+import tracemalloc
+from collections import Counter
+from types import SimpleNamespace
+from urllib.parse import unquote, urlsplit
+
+# Sent as the Moralis key header; the stub ignores it. Mongo is faked and never connected to
+os.environ.setdefault("API_KEY", "bench")
+
+from solders.keypair import Keypair
+import websockets
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import bot
+
+BENCH_CHAT_ID = -1001
+BENCH_SOL_PRICE = 150.0
+
+
+def new_address() -> str:
+    return str(Keypair().pubkey())
+
+
+# ==========================================
+# Stub provider (Moralis + CoinGecko)
+# ==========================================
+class StubProvider:
+    """Minimal HTTP/1.1 keep-alive server with configurable latency and rate limit."""
+
+    def __init__(self, latency: float, jitter: float, rate_limit: float, holdings: dict, prices: dict):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit  # requests per second, 0 = unlimited
+        self.holdings = holdings      # wallet -> [{"mint", "amount"}]
+        self.prices = prices          # mint -> price in SOL
+        self.down: set = set()        # price providers answering 503
+        self.calls = Counter()
+        self._allowance = rate_limit
+        self._last_refill = time.monotonic()
+        self._server = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        self._allowance = min(self.rate_limit, self._allowance + (now - self._last_refill) * self.rate_limit)
+        self._last_refill = now
+        if self._allowance < 1:
+            return True
+        self._allowance -= 1
+        return False
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self._handle(method, target, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self._rate_limited():
+            self.calls["429"] += 1
+            return 429, {"message": "Too many requests"}
+
+        if parts[:1] == ["price"]:
+            self.calls["jupiter.price"] += 1
+            if "jupiter" in self.down:
+                return 503, {"error": "unavailable"}
+            ids = dict(p.split("=", 1) for p in url.query.split("&") if "=" in p).get("ids", "")
+            return 200, {"data": {
+                m: {"id": m, "type": "derivedPrice", "price": str(self.prices[m])}
+                for m in unquote(ids).split(",") if m in self.prices
+            }}
+        if parts[:3] == ["latest", "dex", "tokens"]:
+            self.calls["dexscreener.tokens"] += 1
+            if "dexscreener" in self.down:
+                return 503, {"error": "unavailable"}
+            return 200, {"pairs": [
+                {
+                    "chainId": "solana",
+                    "baseToken": {"address": m},
+                    "quoteToken": {"address": bot.WSOL_MINT},
+                    "priceNative": str(self.prices[m]),
+                    "priceUsd": str(self.prices[m] * BENCH_SOL_PRICE),
+                    "liquidity": {"usd": 50_000},
+                }
+                for m in parts[3].split(",") if m in self.prices
+            ]}
+        if "moralis" in self.down and parts[:1] == ["token"] and parts[-1] in ("price", "prices"):
+            self.calls["moralis.down"] += 1
+            return 503, {"message": "unavailable"}
+
+        if parts[-2:] == ["simple", "price"]:
+            self.calls["coingecko.price"] += 1
+            return 200, {"solana": {"usd": BENCH_SOL_PRICE}}
+        if parts[:1] == ["account"] and parts[-1] == "balance":
+            self.calls["moralis.balance"] += 1
+            return 200, {"lamports": "1500000000", "solana": "1.5"}
+        if parts[:1] == ["account"] and parts[-1] == "tokens":
+            self.calls["moralis.tokens"] += 1
+            return 200, [
+                {"mint": t["mint"], "amount": t["amount"], "decimals": 6, "symbol": "BNCH", "name": "Bench",
+                 "possibleSpam": t.get("spam", False)}
+                for t in self.holdings.get(parts[2], [])
+            ]
+        if parts[:1] == ["token"] and parts[-1] == "prices" and method == "POST":
+            self.calls["moralis.prices_batch"] += 1
+            addresses = json.loads(body or b"{}").get("addresses", [])
+            return 200, [self._price(m) for m in addresses if m in self.prices]
+        if parts[:1] == ["token"] and parts[-1] == "price":
+            self.calls["moralis.price"] += 1
+            if parts[2] not in self.prices:
+                return 404, {"message": "No liquidity pools found"}
+            return 200, self._price(parts[2])
+        if parts[:1] == ["token"] and parts[-1] == "metadata":
+            self.calls["moralis.metadata"] += 1
+            return 200, {"mint": parts[2], "symbol": parts[2][:4].upper(), "name": "Bench", "decimals": "6"}
+        self.calls["unknown"] += 1
+        return 404, {"message": f"no stub for {method} {url.path}"}
+
+    def _price(self, mint: str) -> dict:
+        lamports = self.prices[mint] * 10**9
+        return {
+            "tokenAddress": mint,
+            "nativePrice": {"value": str(int(lamports)), "decimals": 9, "symbol": "WSOL"},
+            "usdPrice": self.prices[mint] * BENCH_SOL_PRICE,
+        }
+
+
+class StubSolanaRpc:
+    """Websocket stand-in for a Solana RPC node: confirms subscriptions and can fake trades."""
+
+    def __init__(self):
+        self.subscriptions: dict = {}  # wallet -> [(websocket, subscription id)]
+        self.reject = Counter()        # method -> how many more requests for it to refuse
+        self._ids = iter(range(1, 10**9))
+        self._server = None
+
+    async def start(self) -> str:
+        self._server = await websockets.serve(self._serve, "127.0.0.1", 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, ws, *_):
+        async for raw in ws:
+            message = json.loads(raw)
+            if self.reject[message["method"]] > 0:
+                self.reject[message["method"]] -= 1
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0", "id": message["id"], "error": {"code": -32602, "message": "rejected"},
+                }))
+                continue
+            params = message["params"]
+            if message["method"] == "accountSubscribe":
+                wallet = params[0]
+            elif message["method"] == "programSubscribe":
+                wallet = params[1]["filters"][0]["memcmp"]["bytes"]
+            else:
+                wallet = params[0]["mentions"][0]
+            subscription = next(self._ids)
+            self.subscriptions.setdefault(wallet, []).append((ws, subscription))
+            await ws.send(json.dumps({"jsonrpc": "2.0", "result": subscription, "id": message["id"]}))
+
+    async def trade(self, wallet: str) -> None:
+        for ws, subscription in self.subscriptions.get(wallet, []):
+            await ws.send(json.dumps({
+                "jsonrpc": "2.0",
+                "method": "logsNotification",
+                "params": {"subscription": subscription, "result": {"value": {"logs": []}}},
+            }))
+
+
+# ==========================================
+# In-memory Mongo
+# ==========================================
+def _matches(doc: dict, query: dict) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$exists" and (key in doc) != arg:
+                    return False
+                if op == "$lt" and not (value is not None and value < arg):
+                    return False
+                if op == "$lte" and not (value is not None and value <= arg):
+                    return False
+                if op == "$gt" and not (value is not None and value > arg):
+                    return False
+                if op == "$gte" and not (value is not None and value >= arg):
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: dict | None) -> dict:
+    if not projection:
+        return dict(doc)
+    included = {k for k, v in projection.items() if v and k != "_id"}
+    out = {k: v for k, v in doc.items() if k in included} if included else dict(doc)
+    for key, spec in projection.items():
+        if isinstance(spec, dict) and "$slice" in spec:
+            out[key] = list(doc.get(key, []))[:spec["$slice"]]
+    if projection.get("_id", 1):
+        out["_id"] = doc.get("_id")
+    else:
+        out.pop("_id", None)
+    return out
+
+
+class FakeCursor:
+    def __init__(self, docs: list):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        self._docs.sort(key=lambda d: d.get(key), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self._docs[:length] if length else list(self._docs)
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self._docs:
+            yield doc
+
+
+class FakeCollection:
+    """Just enough of Motor's AsyncIOMotorCollection for the bot's hot paths."""
+
+    def __init__(self, name: str, unique: tuple = ()):
+        self.name = name
+        self.unique = unique
+        self.docs: list = []
+        self.ops = Counter()
+        self._next_id = 0
+
+    def _check_unique(self, doc: dict) -> None:
+        if self.unique and any(all(d.get(k) == doc.get(k) for k in self.unique) for d in self.docs):
+            raise DuplicateKeyError(f"duplicate key in {self.name}")
+
+    def _store(self, doc: dict) -> None:
+        if "_id" not in doc:
+            self._next_id += 1
+            doc["_id"] = self._next_id
+        elif any(d["_id"] == doc["_id"] for d in self.docs):
+            raise DuplicateKeyError(f"duplicate _id in {self.name}")
+        self._check_unique(doc)
+        self.docs.append(dict(doc))
+
+    def find(self, query=None, projection=None, sort=None):
+        self.ops["find"] += 1
+        cursor = FakeCursor([_project(d, projection) for d in self.docs if _matches(d, query or {})])
+        for key, direction in sort or []:
+            cursor.sort(key, direction)
+        return cursor
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self.ops["find_one"] += 1
+        docs = [d for d in self.docs if _matches(d, query or {})]
+        for key, direction in sort or []:
+            docs.sort(key=lambda d: d.get(key), reverse=direction < 0)
+        return _project(docs[0], projection) if docs else None
+
+    async def insert_one(self, doc):
+        self.ops["insert_one"] += 1
+        self._store(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        self.ops["insert_many"] += 1
+        for doc in docs:
+            try:
+                self._store(doc)
+            except DuplicateKeyError:
+                if ordered:
+                    raise
+
+    async def count_documents(self, query):
+        self.ops["count_documents"] += 1
+        return sum(_matches(d, query) for d in self.docs)
+
+    async def distinct(self, key, query=None):
+        self.ops["distinct"] += 1
+        return list(dict.fromkeys(d.get(key) for d in self.docs if _matches(d, query or {})))
+
+    async def update_one(self, query, update, upsert=False):
+        self.ops["update_one"] += 1
+        for doc in self.docs:
+            if _matches(doc, query):
+                _apply_update(doc, update)
+                return SimpleNamespace(matched_count=1, upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, upserted_id=None)
+        doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+        _apply_update(doc, update, inserting=True)
+        self._store(doc)
+        return SimpleNamespace(matched_count=0, upserted_id=doc["_id"])
+
+    async def bulk_write(self, requests, ordered=True):
+        self.ops["bulk_write"] += 1
+        for request in requests:  # UpdateOne only; pymongo keeps its arguments private
+            await self.update_one(request._filter, request._doc, upsert=request._upsert)
+            self.ops["update_one"] -= 1
+        return SimpleNamespace(acknowledged=True)
+
+    async def update_many(self, query, update, upsert=False):
+        self.ops["update_many"] += 1
+        matched = [doc for doc in self.docs if _matches(doc, query)]
+        for doc in matched:
+            _apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(matched))
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=ReturnDocument.BEFORE):
+        self.ops["find_one_and_update"] += 1
+        docs = [d for d in self.docs if _matches(d, query)]
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: d.get(key), reverse=direction < 0)
+        if not docs:
+            return None
+        before = dict(docs[0])
+        _apply_update(docs[0], update)
+        return dict(docs[0]) if return_document == ReturnDocument.AFTER else before
+
+    async def delete_many(self, query):
+        self.ops["delete_many"] += 1
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def create_indexes(self, indexes):
+        return [i.document["name"] for i in indexes]
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool = False) -> None:
+    for key, value in update.get("$set", {}).items():
+        doc[key] = value
+    for key, value in update.get("$inc", {}).items():
+        doc[key] = doc.get(key, 0) + value
+    for key, value in update.get("$min", {}).items():
+        doc[key] = min(doc[key], value) if key in doc else value
+    for key, value in update.get("$push", {}).items():
+        doc[key] = doc.get(key, []) + [value]
+    for key in update.get("$unset", {}):
+        doc.pop(key, None)
+    if inserting:
+        for key, value in update.get("$setOnInsert", {}).items():
+            doc[key] = value
+
+
+def install_fake_mongo() -> dict:
+    collections = {
+        "picks_collection": FakeCollection("picks", unique=("chat_id", "mint_address")),
+        "wallets_collection": FakeCollection("wallets", unique=("chat_id", "wallet_address")),
+        "snapshots_collection": FakeCollection("leaderboard_snapshots"),
+        "metadata_collection": FakeCollection("token_metadata"),
+        "holdings_collection": FakeCollection("wallet_holdings"),
+        "jobs_collection": FakeCollection("jobs", unique=("dedupe_key", "active")),
+        "denylist_collection": FakeCollection("mint_denylist"),
+        "price_history_collection": FakeCollection("price_history"),
+        "networth_history_collection": FakeCollection("networth_history"),
+        "latest_prices_collection": FakeCollection("latest_prices"),
+    }
+    for attr, collection in collections.items():
+        setattr(bot, attr, collection)
+    return collections
+
+
+def reset_caches() -> None:
+    """Cold-start every in-process cache the bot keeps between commands."""
+    bot.price_cache.clear()
+    bot.price_oracle.clear()
+    bot.unpriceable_mints.clear()
+    bot.mint_denylist = bot.MintDenylist()  # reloads learned strikes from the fake Mongo
+    bot.token_metadata_cache = bot.TTLCache(bot.TOKEN_METADATA_CACHE_SIZE, bot.TOKEN_METADATA_TTL, negative_ttl=60)
+    bot.sol_ticker = bot.SolPriceTicker(bot.SOL_PRICE_MAX_STALENESS)
+
+
+# ==========================================
+# Fake Telegram plumbing
+# ==========================================
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, text: str = ""):
+        self.message_id = next(self._ids)
+        self.text = text
+        self.document = None
+        self.reply_to_message = None
+        self.replies: list = []
+
+    async def reply_text(self, text, **kwargs):
+        reply = FakeMessage(text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        return self
+
+
+def make_update(user_id: int, username: str, text: str = ""):
+    return SimpleNamespace(
+        message=FakeMessage(text),
+        effective_chat=SimpleNamespace(id=BENCH_CHAT_ID, type="private"),
+        effective_user=SimpleNamespace(id=user_id, username=username),
+    )
+
+
+def make_context(args=None):
+    return SimpleNamespace(args=args or [], bot=SimpleNamespace(), job_queue=None)
+
+
+# ==========================================
+# Scenarios
+# ==========================================
+def build_world(wallets: int, tokens: int, mint_pool: int, picks: int, junk: int = 0) -> dict:
+    mints = [new_address() for _ in range(mint_pool)]
+    prices = {m: random.uniform(1e-7, 1e-2) for m in mints}
+    unpriceable = [new_address() for _ in range(mint_pool)]  # no provider knows these
+    holdings = {}
+    wallet_docs = []
+    for i in range(wallets):
+        address = new_address()
+        holdings[address] = [
+            {"mint": m, "amount": f"{random.uniform(1, 1e6):.6f}"}
+            for m in random.sample(mints, min(tokens, mint_pool))
+        ]
+        # Airdropped spam, emptied accounts, dust and dead tokens, in turn
+        for j in range(junk):
+            kind = j % 4
+            holdings[address].append({
+                "mint": random.choice(unpriceable if kind == 3 else mints),
+                "amount": {0: f"{random.uniform(1, 1e9):.6f}", 1: "0", 2: "0.000000001", 3: "1000.0"}[kind],
+                "spam": kind == 0,
+            })
+        wallet_docs.append({
+            "chat_id": BENCH_CHAT_ID,
+            "user_id": i + 1,
+            "username": f"sniper{i + 1}",
+            "wallet_address": address,
+            "start_usd_value": 75.0,
+        })
+    pick_docs = [
+        {
+            "chat_id": BENCH_CHAT_ID,
+            "user_id": 1,
+            "username": "sniper1",
+            "mint_address": mints[i % mint_pool] if i < mint_pool else new_address(),
+            "cost_basis_usd": 75.0,
+            "num_tokens": 1e5,
+        }
+        for i in range(picks)
+    ]
+    return {"mints": mints, "prices": prices, "holdings": holdings, "wallets": wallet_docs, "picks": pick_docs}
+
+
+async def scenario_sniper_leaderboard(world):
+    update = make_update(1, "sniper1", "/sniper_leaderboard refresh")
+    await bot.sniper_leaderboard_command(update, make_context(["refresh"]))
+    return update
+
+
+async def scenario_sniper_leaderboard_snapshot(world):
+    update = make_update(1, "sniper1", "/sniper_leaderboard")
+    await bot.sniper_leaderboard_command(update, make_context())
+    return update
+
+
+async def scenario_my_calls(world):
+    update = make_update(1, "sniper1", "/my_calls")
+    await bot.leader_command(update, make_context())
+    return update
+
+
+async def scenario_share(world):
+    update = make_update(1, "sniper1", "/share")
+    await bot.share_command(update, make_context())
+    return update
+
+
+async def scenario_register_wallet(world):
+    address = new_address()
+    world["holdings"][address] = world["holdings"][world["wallets"][0]["wallet_address"]]
+    user_id = random.randrange(10**6, 10**9)
+    update = make_update(user_id, f"new{user_id}", address)
+    await bot.handle_wallet_address(update, make_context())
+    # Keep the chat the same size for the next iteration
+    bot.wallets_collection.docs = [d for d in bot.wallets_collection.docs if d["wallet_address"] != address]
+    return update
+
+
+SCENARIOS = {
+    "sniper_leaderboard": scenario_sniper_leaderboard,
+    "sniper_leaderboard_snapshot": scenario_sniper_leaderboard_snapshot,
+    "my_calls": scenario_my_calls,
+    "share": scenario_share,
+    "register_wallet": scenario_register_wallet,
+}
+
+
+async def wait_for_tracking(holdings, world, timeout: float = 30) -> None:
+    """Block until the tracker holds live subscriptions for every wallet, then prime holdings."""
+    wanted = {w["wallet_address"] for w in world["wallets"]}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        watched = {d["_id"] for d in holdings.docs if d.get("watched_until")}
+        if wanted <= watched:
+            break
+        await asyncio.sleep(0.1)
+    else:
+        raise RuntimeError("wallet tracker did not subscribe to every wallet in time")
+    await bot.value_wallets(wanted, BENCH_SOL_PRICE)
+
+
+async def churn(rpc, world, share: float) -> None:
+    """Some wallets trade between runs; only those should be re-fetched."""
+    addresses = [w["wallet_address"] for w in world["wallets"]]
+    for wallet in random.sample(addresses, round(len(addresses) * share)):
+        await rpc.trade(wallet)
+    await asyncio.sleep(bot.WALLET_TRACKER_FLUSH_INTERVAL * 1.5)
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _db_ops(collections) -> Counter:
+    ops = Counter()
+    for c in collections.values():
+        ops.update({f"{c.name}.{k}": v for k, v in c.ops.items()})
+    return ops
+
+
+async def run_scenario(name, fn, world, stub, collections, iterations, warm, prepare=None):
+    latencies = []
+    calls_before = Counter(stub.calls)
+    db_before = _db_ops(collections)
+    for _ in range(iterations):
+        if not warm:
+            reset_caches()
+        if prepare is not None:
+            await prepare()
+        started = time.perf_counter()
+        await fn(world)
+        latencies.append((time.perf_counter() - started) * 1000)
+    provider_calls = stub.calls - calls_before
+    db_ops = _db_ops(collections) - db_before
+
+    # tracemalloc slows the interpreter down a lot, so memory gets its own run
+    if not warm:
+        reset_caches()
+    tracemalloc.start()
+    try:
+        await fn(world)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+        "provider_calls_per_run": {k: v / iterations for k, v in sorted(provider_calls.items())},
+        "db_ops_per_run": {k: v / iterations for k, v in sorted(db_ops.items())},
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+async def main(args):
+    random.seed(args.seed)
+    world = build_world(args.wallets, args.tokens, args.mint_pool, args.picks, args.junk)
+    stub = StubProvider(args.latency_ms / 1000, args.jitter_ms / 1000, args.rate_limit, world["holdings"], world["prices"])
+    stub.down = set(filter(None, args.down.split(",")))
+    base_url = await stub.start()
+    bot.MORALIS_API_URL = base_url
+    bot.COINGECKO_API_URL = base_url
+    bot.JUPITER_PRICE_URL = f"{base_url}/price/v2"
+    bot.DEXSCREENER_API_URL = base_url
+    bot.moralis_scheduler = bot.RequestScheduler(args.cu_per_second, args.cu_per_second)
+
+    collections = install_fake_mongo()
+    collections["wallets_collection"].docs = [dict(d, _id=i) for i, d in enumerate(world["wallets"])]
+    collections["picks_collection"].docs = [dict(d, _id=i) for i, d in enumerate(world["picks"])]
+    await bot.load_shilled_mints()
+
+    rpc = tracker = None
+    if args.tracked:
+        rpc = StubSolanaRpc()
+        tracker = asyncio.create_task(bot.WalletTracker(await rpc.start(), heartbeat=5).run())
+        await wait_for_tracking(collections["holdings_collection"], world)
+    prepare = functools.partial(churn, rpc, world, args.churn) if args.tracked else None
+
+    selected = args.scenario or list(SCENARIOS)
+    results = []
+    try:
+        for name in selected:
+            results.append(await run_scenario(
+                name, SCENARIOS[name], world, stub, collections, args.iterations, args.warm, prepare
+            ))
+    finally:
+        if tracker is not None:
+            tracker.cancel()
+            await rpc.stop()
+        await bot.close_http_client()
+        await stub.stop()
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "results": results,
+    }
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    print(
+        f"wallets={args.wallets} tokens={args.tokens} mint_pool={args.mint_pool} picks={args.picks} "
+        f"latency={args.latency_ms}±{args.jitter_ms}ms rate_limit={args.rate_limit or 'off'} "
+        f"caches={'warm' if args.warm else 'cold'}"
+        f"{f' tracked churn={args.churn:g}' if args.tracked else ''}\n"
+    )
+    for r in results:
+        print(
+            f"{r['scenario']:<28} p50 {r['p50_ms']:8.1f}ms  p90 {r['p90_ms']:8.1f}ms  "
+            f"p99 {r['p99_ms']:8.1f}ms  peak {r['peak_memory_kib']:8.0f}KiB"
+        )
+        calls = ", ".join(f"{k}={v:g}" for k, v in r["provider_calls_per_run"].items()) or "none"
+        print(f"{'':<28} provider calls/run: {calls}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wallets", type=int, default=50, help="registered wallets in the chat")
+    parser.add_argument("--tokens", type=int, default=20, help="SPL tokens held per wallet")
+    parser.add_argument("--mint-pool", type=int, default=60, help="distinct mints the holdings are drawn from")
+    parser.add_argument("--picks", type=int, default=20, help="CA picks for the benchmark user")
+    parser.add_argument("--junk", type=int, default=0, help="extra spam/empty/dust/unpriceable tokens per wallet")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub provider latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--down", default="", help="comma-separated price providers the stub fails (moralis,jupiter,dexscreener)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="stub requests/second before 429s (0 = off)")
+    parser.add_argument("--cu-per-second", type=float, default=bot.MORALIS_CU_PER_SECOND,
+                        help="Moralis compute-unit budget for the bot's scheduler")
+    parser.add_argument("--warm", action="store_true", help="keep bot caches between iterations")
+    parser.add_argument("--tracked", action="store_true", help="run the wallet tracker against a local RPC websocket stand-in")
+    parser.add_argument("--churn", type=float, default=0.1, help="with --tracked: share of wallets that trade between runs")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="machine-readable report")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
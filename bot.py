@@ -1,23 +1,44 @@
 #!/usr/bin/env python3
 import os
 import re
+import sys
+import csv
+import json
+import time
+import asyncio
 import logging
-import requests
-from datetime import datetime, UTC
+import heapq
+import random
+import signal
+import socket
+import functools
+import itertools
+import threading
+import contextlib
+import contextvars
+import httpx
+import websockets
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta, UTC
+from typing import NamedTuple
 from urllib.parse import quote
 from solders.pubkey import Pubkey
-from moralis import sol_api
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from telegram import Update, Chat
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from telegram import Update, Chat, ChatMember
 from telegram.ext import (
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     ContextTypes,
     filters,
     ConversationHandler,
 )
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 
 # ==========================================
 # 1. Load Environment Variables
@@ -28,82 +49,1130 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 MONGODB_URI = os.getenv("MONGODB_URI")
 API_KEY = os.getenv("API_KEY")
 
-if not TELEGRAM_BOT_TOKEN or not MONGODB_URI or not API_KEY:
-    raise ValueError("Missing TELEGRAM_BOT_TOKEN or MONGODB_URI or API_KEY in .env")
+def check_settings(*names: str) -> None:
+    """Fail fast at startup (not at import, so tools and tests can import bot.py) when settings are missing."""
+    missing = [name for name in names if not globals().get(name)]
+    if missing:
+        raise ValueError(f"Missing {' or '.join(missing)} in .env")
 
 # ==========================================
-# 2. Logging Configuration
+# 2. Logging & Metrics
 # ==========================================
-# logging.basicConfig(
-#     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-#     level=logging.INFO
-# )
 logger = logging.getLogger(__name__)
 
+def configure_logging() -> None:
+    """Set up the root logger; called from main() so importers keep their own logging setup."""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=os.getenv("LOG_LEVEL", "INFO").upper()
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per request otherwise
+
+PROCESS_STARTED = time.monotonic()  # /healthz uptime and sniperbowl_startup_seconds count from here
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))                            # 0 = no endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")                         # 0.0.0.0 to expose beyond the host
+SLOW_CALL_THRESHOLD = float(os.getenv("SLOW_CALL_THRESHOLD_MS", "0")) / 1000  # 0 = no tracing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Name of the handler a coroutine is running under, so provider calls can be attributed
+current_handler: contextvars.ContextVar = contextvars.ContextVar("current_handler", default="background")
+
+class Metrics:
+    """In-process counters, gauges and histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # PyMongo monitoring events arrive on worker threads
+        self._help: dict = {}
+        self._types: dict = {}
+        self._values: dict = {}        # (name, labels) -> float
+        self._histograms: dict = {}    # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors: list = []    # callables run before each render
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._types[name] = kind
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def add_collector(self, collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = []
+        with self._lock:
+            series: dict = defaultdict(list)
+            for (name, labels), value in self._values.items():
+                series[name].append((labels, value))
+            for (name, labels), hist in self._histograms.items():
+                series[name].append((labels, hist))
+            for name in sorted(series):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types.get(name, 'untyped')}")
+                for labels, value in series[name]:
+                    if isinstance(value, list):
+                        for bound, count in zip(LATENCY_BUCKETS, value):
+                            lines.append(f"{name}_bucket{_labels(labels, le=bound)} {count}")
+                        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {value[-1]}")
+                        lines.append(f"{name}_sum{_labels(labels)} {value[-2]}")
+                        lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+                    else:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+metrics = Metrics()
+metrics.describe("sniperbowl_call_duration_seconds", "histogram", "Latency of handlers and external calls.")
+metrics.describe("sniperbowl_calls_total", "counter", "Handler and external call count.")
+metrics.describe("sniperbowl_call_errors_total", "counter", "Handler and external calls that raised.")
+
+@contextlib.contextmanager
+def track(provider: str, operation: str):
+    """Time a block and record it under (provider, operation, handler)."""
+    labels = {"provider": provider, "operation": operation, "handler": current_handler.get()}
+    started = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise  # a lost hedge or a caller going away, not a failure of the call
+    except BaseException:
+        metrics.inc("sniperbowl_call_errors_total", **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("sniperbowl_call_duration_seconds", elapsed, **labels)
+        metrics.inc("sniperbowl_calls_total", **labels)
+        if SLOW_CALL_THRESHOLD and elapsed >= SLOW_CALL_THRESHOLD:
+            logger.warning(f"Slow call: {provider}.{operation} took {elapsed * 1000:.0f}ms (handler {labels['handler']})")
+
+def instrumented(provider: str, operation: str | None = None):
+    """Decorator form of track() for async provider calls."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with track(provider, operation or fn.__name__):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrumented_handler(fn):
+    """Time a bot handler and tag every call made beneath it with its name."""
+    @functools.wraps(fn)
+    async def wrapper(update, context):
+        token = current_handler.set(fn.__name__)
+        try:
+            with track("handler", fn.__name__):
+                return await fn(update, context)
+        finally:
+            current_handler.reset(token)
+    return wrapper
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command the driver sends."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, failed=False)
+
+    def failed(self, event):
+        self._record(event, failed=True)
+
+    def _record(self, event, failed: bool) -> None:
+        elapsed = event.duration_micros / 1e6
+        labels = {"provider": "mongo", "operation": event.command_name, "handler": "driver"}
+        metrics.observe("sniperbowl_call_duration_seconds", elapsed, **labels)
+        metrics.inc("sniperbowl_calls_total", **labels)
+        if failed:
+            metrics.inc("sniperbowl_call_errors_total", **labels)
+        if SLOW_CALL_THRESHOLD and elapsed >= SLOW_CALL_THRESHOLD:
+            logger.warning(f"Slow call: mongo.{event.command_name} took {elapsed * 1000:.0f}ms")
+
+class InstrumentedRequest(HTTPXRequest):
+    """Telegram Bot API transport that records how long each API method takes."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        with track("telegram", url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
+
+async def _serve_http(routes: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """One-shot HTTP/1.0 responder for the local metrics endpoint."""
+    try:
+        request_line = await reader.readline()
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass  # headers are not needed
+        parts = request_line.decode(errors="replace").split()
+        route = routes.get(parts[1].split("?", 1)[0]) if len(parts) >= 2 else None
+        if route is None:
+            status, content_type, body = 404, "text/plain", "not found\n"
+        else:
+            status, content_type, body = await route()
+        data = body.encode()
+        writer.write(
+            f"HTTP/1.0 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics endpoint request failed: {e}")
+    finally:
+        writer.close()
+
+async def metrics_route():
+    return 200, "text/plain; version=0.0.4", metrics.render()
+
+async def start_http_endpoint(host: str, port: int, routes: dict) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(functools.partial(_serve_http, routes), host, port)
+    logger.info(f"Serving {', '.join(routes)} on {host}:{port}")
+    return server
+
 # ==========================================
 # 3. MongoDB Setup
 # ==========================================
-client = MongoClient(MONGODB_URI)
-db = client["snipe_checks"]
-picks_collection = db["picks"]     # For shilled CAs
-wallets_collection = db["wallets"] # For sniper bowl wallets
+MONGO_DATABASE = "snipe_checks"
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))  # connections per process
+
+_mongo_client: AsyncIOMotorClient | None = None
+
+def get_mongo_client() -> AsyncIOMotorClient:
+    """Shared connection pool, created on first use so that importing bot.py connects to nothing."""
+    global _mongo_client
+    if _mongo_client is None:
+        _mongo_client = AsyncIOMotorClient(
+            MONGODB_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            event_listeners=[MongoCommandMetrics()],
+        )
+    return _mongo_client
+
+def close_mongo_client() -> None:
+    global _mongo_client
+    if _mongo_client is not None:
+        _mongo_client.close()
+        _mongo_client = None
+
+class LazyMongo:
+    """The database (no name) or one of its collections, resolved against get_mongo_client() on first use."""
+
+    def __init__(self, name: str | None = None):
+        self.name = name or MONGO_DATABASE
+        self._collection_name = name
+        self._client = None
+        self._target = None
+
+    def _resolve(self):
+        client = get_mongo_client()
+        if self._client is not client:
+            database = client[MONGO_DATABASE]
+            self._target = database if self._collection_name is None else database[self._collection_name]
+            self._client = client
+        return self._target
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+db = LazyMongo()
+picks_collection = LazyMongo("picks")     # For shilled CAs
+wallets_collection = LazyMongo("wallets") # For sniper bowl wallets
+snapshots_collection = LazyMongo("leaderboard_snapshots") # Materialized sniper bowl standings
+metadata_collection = LazyMongo("token_metadata") # Token symbol/decimals keyed by mint
+holdings_collection = LazyMongo("wallet_holdings") # Last fetched SOL/SPL holdings keyed by wallet
+jobs_collection = LazyMongo("jobs") # Valuation work handed to worker processes
+denylist_collection = LazyMongo("mint_denylist") # Zero-price strikes per mint, see MintDenylist
+price_history_collection = LazyMongo("price_history") # Time series: sampled token prices
+price_hourly_collection = LazyMongo("price_history_hourly") # Time series: hourly rollups of the above
+networth_history_collection = LazyMongo("networth_history") # Time series: wallet net worth per leaderboard refresh
+networth_hourly_collection = LazyMongo("networth_history_hourly") # Time series: hourly rollups of the above
+rollups_collection = LazyMongo("history_rollups") # How far each history series has been rolled up
+latest_prices_collection = LazyMongo("latest_prices") # Last fresh price per mint, read by the global leaderboard
+
+HISTORY_RAW_RETENTION = int(os.getenv("HISTORY_RAW_RETENTION", str(14 * 24 * 3600)))       # seconds
+HISTORY_HOURLY_RETENTION = int(os.getenv("HISTORY_HOURLY_RETENTION", str(365 * 24 * 3600))) # seconds
+
+# Time-series collections bucket samples by their meta field and time, and expire them
+TIME_SERIES = [
+    (price_history_collection, {"timeField": "ts", "metaField": "mint", "granularity": "minutes"}, HISTORY_RAW_RETENTION),
+    (price_hourly_collection, {"timeField": "ts", "metaField": "mint", "granularity": "hours"}, HISTORY_HOURLY_RETENTION),
+    (networth_history_collection, {"timeField": "ts", "metaField": "wallet", "granularity": "minutes"}, HISTORY_RAW_RETENTION),
+    (networth_hourly_collection, {"timeField": "ts", "metaField": "wallet", "granularity": "hours"}, HISTORY_HOURLY_RETENTION),
+]
 
 # Ensure indexes
-picks_collection.create_index(
-    [("chat_id", 1), ("mint_address", 1)],
-    unique=True,
-    name="chat_mint_unique_index"
-)
+INDEXES = [
+    (picks_collection, IndexModel(
+        [("chat_id", 1), ("mint_address", 1)],
+        unique=True,
+        name="chat_mint_unique_index"
+    )),
+    (picks_collection, IndexModel(
+        [("chat_id", 1), ("user_id", 1)],
+        name="chat_user_index"
+    )),
+    (wallets_collection, IndexModel(
+        [("chat_id", 1), ("wallet_address", 1)],
+        unique=True,
+        name="chat_wallet_unique_index"
+    )),
+    (wallets_collection, IndexModel(
+        [("chat_id", 1), ("user_id", 1)],
+        unique=True,
+        name="chat_user_unique_index"
+    )),
+    (snapshots_collection, IndexModel(
+        [("chat_id", 1), ("computed_at", -1)],
+        name="chat_computed_index"
+    )),
+    (snapshots_collection, IndexModel(
+        "computed_at",
+        expireAfterSeconds=int(os.getenv("LEADERBOARD_SNAPSHOT_RETENTION", str(7 * 24 * 3600))),
+        name="computed_at_ttl_index"
+    )),
+    (jobs_collection, IndexModel(
+        [("status", 1), ("priority", 1), ("created_at", 1)],
+        name="status_priority_index"
+    )),
+    (jobs_collection, IndexModel(
+        "dedupe_key",
+        unique=True,
+        partialFilterExpression={"active": True},  # one queued/running job per key
+        name="active_dedupe_unique_index"
+    )),
+    (jobs_collection, IndexModel(
+        "finished_at",
+        expireAfterSeconds=int(os.getenv("JOB_RETENTION", str(24 * 3600))),
+        name="finished_at_ttl_index"
+    )),
+    (price_history_collection, IndexModel(
+        [("mint", 1), ("ts", -1)],
+        name="mint_ts_index"
+    )),
+    (price_hourly_collection, IndexModel(
+        [("mint", 1), ("ts", -1)],
+        name="mint_ts_index"
+    )),
+    (networth_history_collection, IndexModel(
+        [("wallet.chat_id", 1), ("ts", -1)],
+        name="chat_ts_index"
+    )),
+    (networth_hourly_collection, IndexModel(
+        [("wallet.chat_id", 1), ("ts", -1)],
+        name="chat_ts_index"
+    )),
+    (latest_prices_collection, IndexModel(
+        "updated_at",
+        expireAfterSeconds=int(os.getenv("LATEST_PRICE_RETENTION", str(24 * 3600))),  # prices nobody refreshes drop out
+        name="updated_at_ttl_index"
+    )),
+]
+
+async def ensure_indexes() -> None:
+    existing = set(await db.list_collection_names())
+    for collection, timeseries, retention in TIME_SERIES:
+        if collection.name in existing:
+            continue
+        try:
+            await db.create_collection(collection.name, timeseries=timeseries, expireAfterSeconds=retention)
+        except CollectionInvalid:
+            pass  # created by another process in the meantime
+        except OperationFailure as e:
+            # e.g. a server older than MongoDB 5.0; history then lands in plain collections
+            logger.error(f"Could not create time-series collection {collection.name}: {e}")
+    for collection, index in INDEXES:
+        try:
+            await collection.create_indexes([index])
+        except OperationFailure as e:
+            # e.g. existing duplicates block a unique index; keep serving without it
+            logger.error(f"Could not create index {index.document['name']} on {collection.name}: {e}")
+
+WALLET_FIELDS = {"_id": 0, "user_id": 1, "username": 1, "wallet_address": 1, "start_usd_value": 1}
+PICK_FIELDS = {"_id": 0, "user_id": 1, "username": 1, "mint_address": 1, "cost_basis_usd": 1, "num_tokens": 1, "created_at": 1}
+
+async def find_chat_wallets(chat_id: int) -> list:
+    return await wallets_collection.find({"chat_id": chat_id}, WALLET_FIELDS).to_list(None)
+
+async def find_user_picks(chat_id: int, user_id: int) -> list:
+    return await picks_collection.find({"chat_id": chat_id, "user_id": user_id}, PICK_FIELDS).to_list(None)
+
+# chat_id -> mints already shilled there; answers duplicate shills without a query
+shilled_mints: defaultdict = defaultdict(set)
+_shilled_mints_loaded = False
+
+async def load_shilled_mints() -> None:
+    global _shilled_mints_loaded
+    async for doc in picks_collection.find({}, {"_id": 0, "chat_id": 1, "mint_address": 1}):
+        shilled_mints[doc["chat_id"]].add(doc["mint_address"])
+    _shilled_mints_loaded = True
+    logger.info(f"Loaded shilled mints for {len(shilled_mints)} chats")
+
+async def is_already_shilled(chat_id: int, mint_address: str) -> bool:
+    if mint_address in shilled_mints[chat_id]:
+        return True
+    if _shilled_mints_loaded:
+        return False  # Unique index still guards against a racing insert
+    existing_pick = await picks_collection.find_one({"chat_id": chat_id, "mint_address": mint_address}, {"_id": 1})
+    return existing_pick is not None
 
 # ==========================================
-# 4. API Calls
+# 4. Caches
 # ==========================================
-def get_sol_price() -> float:
-    url = "https://api.coingecko.com/api/v3/simple/price"
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL. Concurrent misses for the same key
+    share a single in-flight fetch instead of each hitting the provider, as
+    long as that fetch runs at the caller's request_priority or better; an
+    interactive caller never waits on a background fetch stuck in the queue.
+    Falsy results (failed lookups) are kept for `negative_ttl` seconds only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float | None = None, ttl_for=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.ttl_for = ttl_for  # optional value -> ttl override
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._inflight: dict = {}                # key -> (priority, asyncio.Task)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value) -> None:
+        if self.ttl_for is not None:
+            ttl = self.ttl_for(value)
+        else:
+            ttl = self.ttl if value else self.negative_ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_fetch(self, key, fetch):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        task = self._joinable(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch(key))
+            self._inflight[key] = (request_priority.get(), task)
+            task.add_done_callback(functools.partial(self._on_fetched, key))
+        else:
+            self.coalesced += 1
+        # Shield so one cancelled caller does not cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    async def get_many_or_fetch(self, keys, fetch_many, default=None) -> dict:
+        """
+        Like get_or_fetch for a set of keys: every key that is neither cached nor
+        already in flight goes out in one `fetch_many(keys) -> dict` call.
+        """
+        results = {}
+        waiting = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                results[key] = value
+            elif (task := self._joinable(key)) is not None:
+                self.coalesced += 1
+                waiting[key] = task
+            else:
+                missing.append(key)
+        if missing:
+            self.misses += len(missing)
+            batch = asyncio.ensure_future(fetch_many(missing))
+            for key in missing:
+                task = asyncio.ensure_future(self._pick(batch, key, default))
+                self._inflight[key] = (request_priority.get(), task)
+                task.add_done_callback(functools.partial(self._on_fetched, key))
+                waiting[key] = task
+        if waiting:
+            values = await asyncio.shield(asyncio.gather(*waiting.values()))
+            results.update(zip(waiting.keys(), values))
+        return results
+
+    def _joinable(self, key) -> asyncio.Task | None:
+        # A fetch runs at the priority of whoever started it, so only join one
+        # that is at least as urgent as the current caller
+        priority, task = self._inflight.get(key, (None, None))
+        if task is not None and priority <= request_priority.get():
+            return task
+        return None
+
+    @staticmethod
+    async def _pick(batch: asyncio.Future, key, default):
+        return (await batch).get(key, default)
+
+    def _on_fetched(self, key, task: asyncio.Task) -> None:
+        if self._inflight.get(key, (None, None))[1] is task:
+            del self._inflight[key]  # not a newer, more urgent fetch for the same key
+        if not task.cancelled() and task.exception() is None:
+            self.set(key, task.result())
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "60"))                   # seconds
+PRICE_CACHE_NEGATIVE_TTL = float(os.getenv("PRICE_CACHE_NEGATIVE_TTL", "15")) # seconds
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "5000"))
+
+def _price_ttl(quote) -> float:
+    # Missing or stale quotes are only kept briefly so they get revalidated soon
+    return PRICE_CACHE_TTL if quote.price > 0 and not quote.age else PRICE_CACHE_NEGATIVE_TTL
+
+price_cache = TTLCache(PRICE_CACHE_SIZE, PRICE_CACHE_TTL, ttl_for=_price_ttl)
+
+# ==========================================
+# 5. API Calls
+# ==========================================
+MORALIS_API_URL = os.getenv("MORALIS_API_URL", "https://solana-gateway.moralis.io")
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))                 # seconds, per call
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # seconds
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+_http_client: httpx.AsyncClient | None = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive client; every provider call goes through this pool."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+            headers={"Accept": "application/json"},
+        )
+    return _http_client
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Every Moralis call shares one API key, so all of them draw from one compute-unit
+# bucket. Interactive commands are served before background refreshes.
+MORALIS_CU_PER_SECOND = float(os.getenv("MORALIS_CU_PER_SECOND", "1000"))
+MORALIS_CU_BURST = float(os.getenv("MORALIS_CU_BURST", str(MORALIS_CU_PER_SECOND)))
+MORALIS_MAX_RETRIES = int(os.getenv("MORALIS_MAX_RETRIES", "4"))
+MORALIS_BACKOFF_BASE = float(os.getenv("MORALIS_BACKOFF_BASE", "0.5"))  # seconds
+
+# Approximate compute units per call, keyed by the last path segment.
+# Adjust these to the weights published for your Moralis plan.
+MORALIS_CU_COSTS = {
+    "balance": 10,
+    "tokens": 10,
+    "price": 10,
+    "prices": 100,
+    "metadata": 10,
+}
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# Priority class of the current task; background jobs switch this to PRIORITY_BACKGROUND
+request_priority: contextvars.ContextVar = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+metrics.describe("sniperbowl_moralis_queue_depth", "gauge", "Moralis calls waiting for compute units.")
+metrics.describe("sniperbowl_moralis_queue_wait_seconds", "histogram", "Time spent waiting for compute units.")
+metrics.describe("sniperbowl_moralis_throttled_total", "counter", "HTTP 429 responses from Moralis.")
+
+class RequestScheduler:
+    """
+    Token bucket (compute units per second) with strict priority classes.
+    Waiters are granted in (priority, arrival) order; a lower class only gets
+    units while no higher-priority call is queued.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._waiters: list = []  # heap of (priority, seq, cost, future)
+        self._seq = itertools.count()
+        self._depth = Counter()
+        self._wakeup: asyncio.TimerHandle | None = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost: float, priority: int = PRIORITY_INTERACTIVE) -> None:
+        cost = min(cost, self.burst)
+        self._refill()
+        if not self._waiters and self._tokens >= cost:
+            self._tokens -= cost
+            return
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), cost, future))
+        self._depth[priority] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._tokens += cost  # granted just as we were cancelled; give it back
+            raise
+        finally:
+            metrics.observe("sniperbowl_moralis_queue_wait_seconds", time.perf_counter() - started,
+                            priority=PRIORITY_NAMES.get(priority, priority))
+
+    def penalize(self) -> None:
+        """The provider throttled us: empty the bucket so every caller backs off."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+    def _dispatch(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._refill()
+        while self._waiters:
+            priority, _, cost, future = self._waiters[0]
+            if not future.cancelled() and self._tokens < cost:
+                break
+            heapq.heappop(self._waiters)
+            self._depth[priority] -= 1
+            if not future.cancelled():
+                self._tokens -= cost
+                future.set_result(None)
+        if self._waiters:
+            deficit = self._waiters[0][2] - self._tokens
+            self._wakeup = asyncio.get_running_loop().call_later(max(deficit / self.rate, 0.001), self._dispatch)
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.set("sniperbowl_moralis_queue_depth", self._depth[priority], priority=name)
+
+moralis_scheduler = RequestScheduler(MORALIS_CU_PER_SECOND, MORALIS_CU_BURST)
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return float(retry_after)
+    backoff = MORALIS_BACKOFF_BASE * 2 ** attempt
+    return random.uniform(backoff / 2, backoff)  # jitter so throttled callers do not retry in lockstep
+
+async def _moralis_request(method: str, path: str, timeout: float | None = None, **kwargs):
+    cost = MORALIS_CU_COSTS.get(path.rsplit("/", 1)[-1], 10)
+    for attempt in range(MORALIS_MAX_RETRIES + 1):
+        await moralis_scheduler.acquire(cost, request_priority.get())
+        response = await get_http_client().request(
+            method,
+            f"{MORALIS_API_URL}{path}",
+            headers={"X-API-Key": API_KEY},
+            timeout=timeout or HTTP_TIMEOUT,
+            **kwargs,
+        )
+        if response.status_code != 429 or attempt == MORALIS_MAX_RETRIES:
+            break
+        metrics.inc("sniperbowl_moralis_throttled_total")
+        moralis_scheduler.penalize()
+        await asyncio.sleep(_retry_delay(response, attempt))
+    response.raise_for_status()
+    return response.json()
+
+async def moralis_get(path: str, params: dict | None = None, timeout: float | None = None):
+    return await _moralis_request("GET", path, timeout=timeout, params=params)
+
+async def moralis_post(path: str, body: dict, timeout: float | None = None):
+    return await _moralis_request("POST", path, timeout=timeout, json=body)
+
+async def get_sol_price() -> float:
     params = {
         "ids": "solana",
         "vs_currencies": "usd"
         }
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        return (float(data["solana"]["usd"]))
+        # Tracked inside the try so a failure is counted before it is swallowed
+        with track("coingecko", "get_sol_price"):
+            response = await get_http_client().get(f"{COINGECKO_API_URL}/simple/price", params=params)
+            data = response.json()
+            return (float(data["solana"]["usd"]))
     except Exception as e:
         logger.error(f"Error fetching SOL price: {e}")
         return 0.0
 
-def get_sol_balance(wallet_address: str) -> float:
-    params = {
-        "network": "mainnet",
-        "address": wallet_address
-    }
-    result = sol_api.account.balance(
-        api_key=API_KEY,
-        params=params,
-    )
+SOL_PRICE_REFRESH_INTERVAL = float(os.getenv("SOL_PRICE_REFRESH_INTERVAL", "30"))  # seconds
+SOL_PRICE_MAX_STALENESS = float(os.getenv("SOL_PRICE_MAX_STALENESS", "900"))       # seconds
+
+class SolPriceTicker:
+    """Last good SOL/USD quote, kept fresh by a job-queue refresher."""
+
+    def __init__(self, max_staleness: float):
+        self.max_staleness = max_staleness
+        self.price = 0.0
+        self.updated_at: float | None = None  # time.monotonic() of last good quote
+        self._lock = asyncio.Lock()
+
+    @property
+    def age(self) -> float | None:
+        if self.updated_at is None:
+            return None
+        return time.monotonic() - self.updated_at
+
+    def current(self) -> float:
+        """The last good quote, or 0.0 if there is none within the staleness limit."""
+        age = self.age
+        if age is None or age > self.max_staleness:
+            return 0.0
+        return self.price
+
+    async def refresh(self, only_if_empty: bool = False) -> None:
+        async with self._lock:
+            if only_if_empty and self.updated_at is not None:
+                return  # another caller fetched it while we waited
+            price = await get_sol_price()
+            if price > 0:
+                self.price = price
+                self.updated_at = time.monotonic()
+                record_price_sample(SOL_USD_SERIES, price)
+            elif self.updated_at is not None:
+                logger.warning(f"SOL price refresh failed; serving quote {self.age:.0f}s old")
+
+sol_ticker = SolPriceTicker(SOL_PRICE_MAX_STALENESS)
+
+async def refresh_sol_price_job(context: ContextTypes.DEFAULT_TYPE):
+    await sol_ticker.refresh()
+
+async def current_sol_price() -> float:
+    """SOL/USD for handlers. Only touches the network before the first quote lands."""
+    if sol_ticker.updated_at is None:
+        await sol_ticker.refresh(only_if_empty=True)
+    return sol_ticker.current()
+
+@instrumented("moralis")
+async def get_sol_balance(wallet_address: str) -> float:
+    result = await moralis_get(f"/account/mainnet/{wallet_address}/balance")
     return float(result.get("solana"))
 
-def get_latest_close_price_in_sol(mint_address: str) -> float:
-    try:
-        params = {
-            "network": "mainnet",
-            "address": mint_address
-        }
-        result = sol_api.token.get_token_price(
-            api_key=API_KEY,
-            params=params,
+async def get_price_quote(mint_address: str) -> "PriceQuote":
+    """Price in SOL together with its age (non-zero when a stale fallback was used)."""
+    return (await get_price_quotes([mint_address]))[mint_address]
+
+async def get_price_quotes(mint_addresses) -> dict:
+    """Quotes for many mints; cached ones are free, the rest go to the oracle in batches."""
+    return await price_cache.get_many_or_fetch(mint_addresses, price_batcher.fetch, NO_PRICE)
+
+async def get_prices_in_sol(mint_addresses) -> dict:
+    return {mint: quote.price for mint, quote in (await get_price_quotes(mint_addresses)).items()}
+
+MORALIS_PRICE_BATCH_SIZE = int(os.getenv("MORALIS_PRICE_BATCH_SIZE", "100"))
+
+PRICE_BATCH_WINDOW = float(os.getenv("PRICE_BATCH_WINDOW_MS", "25")) / 1000
+
+class MicroBatcher:
+    """
+    Merges fetch_many(keys) calls that arrive within `window` seconds (or until
+    `max_size` keys are queued) into a single call, so wallets valued in
+    parallel still share batch price requests. Each request_priority gets its
+    own batch, run at that priority; callers only join a batch at least as
+    urgent as they are, so interactive keys never ride in a background batch.
+    """
+
+    def __init__(self, fetch_many, window: float, max_size: int):
+        self.fetch_many = fetch_many
+        self.window = window
+        self.max_size = max_size
+        self._keys: dict = {}     # priority -> queued keys
+        self._futures: dict = {}  # priority -> asyncio.Future for that batch
+        self._timers: dict = {}   # priority -> asyncio.TimerHandle
+
+    async def fetch(self, keys) -> dict:
+        loop = asyncio.get_running_loop()
+        mine = request_priority.get()
+        priority = min((p for p in self._futures if p <= mine), default=mine)
+        if priority not in self._futures:
+            self._keys[priority] = []
+            self._futures[priority] = loop.create_future()
+            self._timers[priority] = loop.call_later(self.window, self._flush, priority)
+        future = self._futures[priority]
+        self._keys[priority].extend(keys)
+        if len(self._keys[priority]) >= self.max_size:
+            self._flush(priority)
+        return await asyncio.shield(future)
+
+    def _flush(self, priority: int) -> None:
+        self._timers.pop(priority).cancel()
+        keys, future = self._keys.pop(priority), self._futures.pop(priority)
+        task = asyncio.ensure_future(self._fetch_at(priority, keys))
+        task.add_done_callback(functools.partial(self._resolve, future))
+
+    async def _fetch_at(self, priority: int, keys: list) -> dict:
+        request_priority.set(priority)  # this task's own context, not the first caller's
+        return await self.fetch_many(keys)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, task: asyncio.Task) -> None:
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+# ------------ Price oracle ------------
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+
+JUPITER_PRICE_URL = os.getenv("JUPITER_PRICE_URL", "https://api.jup.ag/price/v2")
+DEXSCREENER_API_URL = os.getenv("DEXSCREENER_API_URL", "https://api.dexscreener.com")
+
+PRICE_PROVIDERS = os.getenv("PRICE_PROVIDERS", "moralis,jupiter,dexscreener")  # primary first
+PRICE_PROVIDER_TIMEOUT = float(os.getenv("PRICE_PROVIDER_TIMEOUT", "10"))      # seconds
+PRICE_HEDGE_PERCENTILE = float(os.getenv("PRICE_HEDGE_PERCENTILE", "90"))
+PRICE_HEDGE_DEFAULT_DELAY = float(os.getenv("PRICE_HEDGE_DEFAULT_DELAY", "1.0"))  # seconds, before stats exist
+PRICE_BREAKER_FAILURES = int(os.getenv("PRICE_BREAKER_FAILURES", "5"))
+PRICE_BREAKER_RESET = float(os.getenv("PRICE_BREAKER_RESET", "30"))               # seconds
+PRICE_STALE_MAX_AGE = float(os.getenv("PRICE_STALE_MAX_AGE", "3600"))             # seconds
+
+metrics.describe("sniperbowl_price_hedges_total", "counter", "Secondary price providers raced against a slow one.")
+metrics.describe("sniperbowl_price_stale_total", "counter", "Prices served from the last known value.")
+metrics.describe("sniperbowl_price_breaker_open", "gauge", "1 while a price provider's circuit breaker is open.")
+
+class PriceQuote(NamedTuple):
+    price: float   # in SOL; 0.0 when unknown
+    age: float     # seconds since the price was observed; 0.0 for a fresh quote
+    source: str
+
+NO_PRICE = PriceQuote(0.0, 0.0, "none")      # no provider could be asked
+UNPRICED = PriceQuote(0.0, 0.0, "unpriced")  # every provider answered without a price
+
+class PriceProvider:
+    """Adapter interface: prices in SOL for a batch of mints. Unknown mints are left out."""
+
+    name = "base"
+
+    async def fetch_prices(self, mint_addresses: list) -> dict:
+        raise NotImplementedError
+
+def _chunks(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+async def _gather_chunks(calls) -> list:
+    """Run chunk requests together; only fail if every chunk failed."""
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    ok = [r for r in results if not isinstance(r, Exception)]
+    if results and not ok:
+        raise results[0]
+    return ok
+
+class MoralisPriceProvider(PriceProvider):
+    name = "moralis"
+
+    async def fetch_prices(self, mint_addresses: list) -> dict:
+        if len(mint_addresses) == 1:
+            # The single-token endpoint costs less than a batch of one
+            try:
+                result = await moralis_get(f"/token/mainnet/{mint_addresses[0]}/price")
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code in (400, 404):
+                    return {}  # no pool / not a token: unknown, not a provider failure
+                raise
+            results = [[dict(result, tokenAddress=mint_addresses[0])]]
+        else:
+            results = await _gather_chunks(
+                moralis_post("/token/mainnet/prices", {"addresses": chunk})
+                for chunk in _chunks(mint_addresses, MORALIS_PRICE_BATCH_SIZE)
+            )
+        prices = {}
+        for item in itertools.chain.from_iterable(results):
+            try:
+                prices[item["tokenAddress"]] = float(item.get("nativePrice", {}).get("value", 0))/10**9
+            except (KeyError, TypeError, ValueError):
+                continue
+        return prices
+
+class JupiterPriceProvider(PriceProvider):
+    name = "jupiter"
+    batch_size = 100
+
+    async def fetch_prices(self, mint_addresses: list) -> dict:
+        async def fetch(chunk):
+            response = await get_http_client().get(
+                JUPITER_PRICE_URL,
+                params={"ids": ",".join(chunk), "vsToken": WSOL_MINT},
+                timeout=PRICE_PROVIDER_TIMEOUT,
+            )
+            response.raise_for_status()
+            return response.json().get("data") or {}
+
+        prices = {}
+        for data in await _gather_chunks(fetch(c) for c in _chunks(mint_addresses, self.batch_size)):
+            for mint, item in data.items():
+                try:
+                    prices[mint] = float(item["price"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return prices
+
+class DexScreenerPriceProvider(PriceProvider):
+    """Most liquid Solana pair per token; USD prices are converted at the ticker's SOL price."""
+
+    name = "dexscreener"
+    batch_size = 30
+
+    async def fetch_prices(self, mint_addresses: list) -> dict:
+        async def fetch(chunk):
+            response = await get_http_client().get(
+                f"{DEXSCREENER_API_URL}/latest/dex/tokens/{','.join(chunk)}",
+                timeout=PRICE_PROVIDER_TIMEOUT,
+            )
+            response.raise_for_status()
+            return response.json().get("pairs") or []
+
+        sol_price = sol_ticker.current()
+        wanted = set(mint_addresses)
+        best = {}  # mint -> (liquidity_usd, price_in_sol)
+        for pairs in await _gather_chunks(fetch(c) for c in _chunks(mint_addresses, self.batch_size)):
+            for pair in pairs:
+                mint = (pair.get("baseToken") or {}).get("address")
+                if pair.get("chainId") != "solana" or mint not in wanted:
+                    continue
+                try:
+                    if (pair.get("quoteToken") or {}).get("address") == WSOL_MINT:
+                        price = float(pair["priceNative"])
+                    elif sol_price > 0:
+                        price = float(pair["priceUsd"]) / sol_price
+                    else:
+                        continue
+                except (KeyError, TypeError, ValueError):
+                    continue
+                liquidity = float((pair.get("liquidity") or {}).get("usd") or 0)
+                if mint not in best or liquidity > best[mint][0]:
+                    best[mint] = (liquidity, price)
+        return {mint: price for mint, (_, price) in best.items()}
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one trial through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._trial_running or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self._trial_running = True  # half-open
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        self._trial_running = False
+
+class PriceOracle:
+    """
+    Prices through an ordered list of providers. The primary is asked first;
+    if it has not answered by its own latency percentile, the next provider is
+    raced against it, and failed or partial answers fall through to the next.
+    Providers behind an open circuit breaker are skipped. Mints nobody could
+    price fall back to the last known price, reported with its age.
+    """
+
+    def __init__(self, providers: list):
+        self.providers = providers
+        self.breakers = {p.name: CircuitBreaker(PRICE_BREAKER_FAILURES, PRICE_BREAKER_RESET) for p in providers}
+        self.latencies = {p.name: deque(maxlen=200) for p in providers}
+        self.last_known = TTLCache(PRICE_CACHE_SIZE * 2, PRICE_STALE_MAX_AGE)  # mint -> (price, wall time)
+
+    def hedge_delay(self, provider: PriceProvider) -> float:
+        samples = self.latencies[provider.name]
+        if len(samples) < 10:
+            return PRICE_HEDGE_DEFAULT_DELAY
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * PRICE_HEDGE_PERCENTILE / 100))]
+
+    async def _ask(self, provider: PriceProvider, mint_addresses: list) -> dict | None:
+        breaker = self.breakers[provider.name]
+        started = time.perf_counter()
+        try:
+            with track(provider.name, "get_prices"):
+                prices = await asyncio.wait_for(provider.fetch_prices(mint_addresses), PRICE_PROVIDER_TIMEOUT)
+        except asyncio.CancelledError:
+            breaker.record_abandoned()  # lost the race; says nothing about its health
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            logger.warning(f"Price provider {provider.name} failed for {len(mint_addresses)} mints: {e!r}")
+            return None
+        finally:
+            metrics.set("sniperbowl_price_breaker_open", int(breaker.is_open), provider=provider.name)
+        breaker.record_success()
+        self.latencies[provider.name].append(time.perf_counter() - started)
+        return prices
+
+    async def fetch_quotes(self, mint_addresses: list) -> dict:
+        remaining = set(mint_addresses)
+        quotes = {}
+        answered = set()  # providers that answered at all, as opposed to failing or being skipped
+        queue = list(self.providers)
+        running = {}  # task -> provider
+
+        def launch() -> PriceProvider | None:
+            # Breakers are only asked when a provider is really started, since
+            # a half-open breaker admits exactly one trial and waits for its outcome
+            while queue:
+                provider = queue.pop(0)
+                if self.breakers[provider.name].allow():
+                    running[asyncio.ensure_future(self._ask(provider, sorted(remaining)))] = provider
+                    return provider
+            return None
+
+        try:
+            launch()
+            while running and remaining:
+                newest = list(running.values())[-1]
+                done, _ = await asyncio.wait(
+                    running, timeout=self.hedge_delay(newest) if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedge = launch()
+                    if hedge is not None:
+                        metrics.inc("sniperbowl_price_hedges_total", provider=hedge.name)
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    prices = task.result()
+                    if prices is None:
+                        continue
+                    answered.add(provider.name)
+                    now = time.time()
+                    for mint, price in prices.items():
+                        if mint in remaining and price > 0:
+                            quotes[mint] = PriceQuote(price, 0.0, provider.name)
+                            self.last_known.set(mint, (price, now))
+                            record_price_sample(mint, price)
+                            remaining.discard(mint)
+                if remaining and not running:
+                    launch()  # failed or partial answer: ask the next provider for the rest
+        finally:
+            for task in running:
+                task.cancel()
+
+        now = time.time()
+        for mint in remaining:
+            known = self.last_known.get(mint)
+            if known:
+                metrics.inc("sniperbowl_price_stale_total")
+                quotes[mint] = PriceQuote(known[0], now - known[1], "stale")
+            elif answered == {p.name for p in self.providers}:
+                quotes[mint] = UNPRICED  # every provider answered and none of them knows it
+        return quotes
+
+    def clear(self) -> None:
+        self.last_known.clear()
+
+PRICE_PROVIDER_TYPES = {
+    p.name: p for p in (MoralisPriceProvider, JupiterPriceProvider, DexScreenerPriceProvider)
+}
+
+PRICE_PROVIDER_NAMES = [name.strip() for name in PRICE_PROVIDERS.split(",") if name.strip()]
+
+def check_price_providers() -> None:
+    """Fail fast at startup, like check_settings, on a misspelt or empty PRICE_PROVIDERS."""
+    unknown = [name for name in PRICE_PROVIDER_NAMES if name not in PRICE_PROVIDER_TYPES]
+    if unknown or not PRICE_PROVIDER_NAMES:
+        raise ValueError(
+            f"Unknown PRICE_PROVIDERS {', '.join(unknown) or '(none given)'} in .env; "
+            f"choose from {', '.join(PRICE_PROVIDER_TYPES)}"
         )
-        price = float(result.get("nativePrice", {}).get("value", 0))/10**9
-        return price
-    except Exception as e:
-        # logger.error(f"Error fetching token price for {mint_address}: {e}")
-        return 0.0
+
+# Unknown names are skipped here and reported by check_price_providers at startup
+price_oracle = PriceOracle([
+    PRICE_PROVIDER_TYPES[name]() for name in PRICE_PROVIDER_NAMES if name in PRICE_PROVIDER_TYPES
+])
+
+price_batcher = MicroBatcher(lambda mints: price_oracle.fetch_quotes(mints), PRICE_BATCH_WINDOW, MORALIS_PRICE_BATCH_SIZE)
+
+# Base58 public keys are 32-44 characters; anything else cannot be an address
+_BASE58_ADDRESS_RE = re.compile(r"[1-9A-HJ-NP-Za-km-z]{32,44}")
+
+def looks_like_solana_address(text: str) -> bool:
+    """Cheap pre-filter: length check, then one compiled regex. No allocation."""
+    return 32 <= len(text) <= 44 and _BASE58_ADDRESS_RE.fullmatch(text) is not None
 
 def is_valid_solana_address(address: str) -> bool:
-    # if len(address) not in [43, 44]:
-    #     return False
-    # pattern = r'^[1-9A-HJ-NP-Za-km-z]+$'
-    # return bool(re.match(pattern, address))
+    if not looks_like_solana_address(address):
+        return False
     try:
         pubkey = Pubkey.from_string(address)
         # Optional: check if the pubkey is on the ed25519 curve
@@ -112,43 +1181,1287 @@ def is_valid_solana_address(address: str) -> bool:
     except Exception:
         return False
 
-def get_wallet_balances(wallet_address: str) -> dict:
+@instrumented("moralis")
+async def get_wallet_balances(wallet_address: str) -> list:
     params = {
-        "exclude_spam": False,
-        "network": "mainnet",
-        "address": wallet_address
+        "excludeSpam": "false",
     }
-
-    result = sol_api.account.get_spl(
-        api_key=API_KEY,
-        params=params,
-    )
+    result = await moralis_get(f"/account/mainnet/{wallet_address}/tokens", params=params)
     tokens=[]
     for i in result:
-        tokens.append({"mint":i.get("mint"),"amount":i.get("amount")})
+        tokens.append({"mint":i.get("mint"),"amount":i.get("amount"),"possible_spam":bool(i.get("possibleSpam", False))})
     return tokens
 
-def get_tiker(wallet_address: str) -> str:
+TOKEN_METADATA_TTL = float(os.getenv("TOKEN_METADATA_TTL", str(24 * 3600)))  # seconds in memory
+TOKEN_METADATA_CACHE_SIZE = int(os.getenv("TOKEN_METADATA_CACHE_SIZE", "20000"))
+
+token_metadata_cache = TTLCache(TOKEN_METADATA_CACHE_SIZE, TOKEN_METADATA_TTL, negative_ttl=60)
+
+def _collect_cache_stats() -> None:
+    for name, cache in (("price", price_cache), ("token_metadata", token_metadata_cache)):
+        for stat, value in cache.stats().items():
+            metrics.set(f"sniperbowl_cache_{stat}", value, cache=name)
+
+for _stat in ("size", "hits", "misses", "coalesced"):
+    metrics.describe(f"sniperbowl_cache_{_stat}", "gauge", f"In-process cache {_stat}.")
+metrics.add_collector(_collect_cache_stats)
+
+async def get_token_metadata_many(mint_addresses) -> dict:
+    """
+    Symbol, name, decimals and spam flag for a list of mints: memory first, then
+    one Mongo query for everything not in memory, then Moralis.
+    """
+    return await token_metadata_cache.get_many_or_fetch(mint_addresses, _load_token_metadata_many)
+
+async def _load_token_metadata_many(mint_addresses: list) -> dict:
+    cursor = metadata_collection.find({"_id": {"$in": mint_addresses}})
+    found = {doc["_id"]: doc async for doc in cursor}
+    missing = [m for m in mint_addresses if m not in found]
+    if missing:
+        fetched = [doc for doc in await asyncio.gather(*map(_fetch_token_metadata, missing)) if doc]
+        if fetched:
+            try:
+                await metadata_collection.insert_many(fetched, ordered=False)
+            except BulkWriteError:
+                pass  # Another handler stored the same mint first
+        found.update((doc["_id"], doc) for doc in fetched)
+    return found
+
+async def _fetch_token_metadata(mint_address: str) -> dict | None:
+    try:
+        with track("moralis", "get_tiker"):
+            result = await moralis_get(f"/token/mainnet/{mint_address}/metadata")
+    except Exception as e:
+        logger.error(f"Error fetching token metadata for {mint_address}: {e}")
+        return None
+    return {
+        "_id": mint_address,
+        "symbol": result.get("symbol") or "N/A",
+        "name": result.get("name"),
+        "decimals": int(result.get("decimals") or 0),
+        "possible_spam": bool(result.get("possibleSpam", False)),
+        "fetched_at": datetime.now(UTC),
+    }
+
+def ticker_of(metadata: dict | None) -> str:
+    return metadata["symbol"] if metadata else "N/A"
+
+
+# ==========================================
+# 6. Wallet Valuation
+# ==========================================
+VALUATION_CONCURRENCY = int(os.getenv("VALUATION_CONCURRENCY", "10"))        # wallets fetched at once
+VALUATION_WALLET_TIMEOUT = float(os.getenv("VALUATION_WALLET_TIMEOUT", "30"))  # seconds per wallet
+HOLDINGS_MAX_AGE = float(os.getenv("HOLDINGS_MAX_AGE", "900"))  # seconds; clean holdings are refetched after this
+
+metrics.describe("sniperbowl_holdings_lookups_total", "counter", "Wallet holdings served from cache vs fetched.")
+
+async def get_wallet_holdings(wallet_address: str) -> tuple:
+    """
+    (sol_balance, [{"mint", "amount"}, ...]) for one wallet. Holdings cached in
+    wallet_holdings are reused while the wallet tracker vouches for them (clean
+    and watched) and they are younger than HOLDINGS_MAX_AGE, which bounds what
+    a missed notification can cost; otherwise they are fetched and stored for
+    next time.
+    """
+    cached = await holdings_collection.find_one({"_id": wallet_address})
+    if cached and not cached.get("dirty", True) and _is_watched(cached) and _is_recent(cached):
+        metrics.inc("sniperbowl_holdings_lookups_total", result="cached")
+        return cached["sol_balance"], cached["tokens"]
+
+    metrics.inc("sniperbowl_holdings_lookups_total", result="fetched")
+    version = cached.get("version", 0) if cached else 0
+    sol_balance, tokens = await asyncio.gather(
+        get_sol_balance(wallet_address),
+        get_wallet_balances(wallet_address),
+    )
+    try:
+        # Only mark clean if no change notification arrived while we were fetching
+        await holdings_collection.update_one(
+            {"_id": wallet_address, "version": version},
+            {"$set": {
+                "sol_balance": sol_balance,
+                "tokens": tokens,
+                "synced_at": datetime.now(UTC),
+                "dirty": False,
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass  # version moved on; the next valuation fetches again
+    return sol_balance, tokens
+
+def _as_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:  # PyMongo hands back naive UTC datetimes
+        return moment.replace(tzinfo=UTC)
+    return moment
+
+def _is_watched(holdings: dict) -> bool:
+    watched_until = holdings.get("watched_until")
+    if watched_until is None:
+        return False
+    return _as_utc(watched_until) > datetime.now(UTC)
+
+def _is_recent(holdings: dict) -> bool:
+    synced_at = holdings.get("synced_at")
+    if synced_at is None:
+        return False
+    return datetime.now(UTC) - _as_utc(synced_at) < timedelta(seconds=HOLDINGS_MAX_AGE)
+
+# ------------ Valuation pre-filter ------------
+# Contest wallets collect airdropped spam and empty token accounts. Those are
+# dropped before pricing, and mints providers cannot price are remembered so
+# they are only asked about again now and then.
+DUST_AMOUNT = float(os.getenv("DUST_AMOUNT", "0.000001"))  # balances at or below this many tokens are ignored
+UNPRICEABLE_RECHECK = float(os.getenv("UNPRICEABLE_RECHECK", str(6 * 3600)))  # seconds until an unpriced mint is asked again
+UNPRICEABLE_CACHE_SIZE = int(os.getenv("UNPRICEABLE_CACHE_SIZE", "20000"))
+DENYLIST_STRIKES = int(os.getenv("DENYLIST_STRIKES", "3"))  # unpriced checks before a mint is denylisted
+DENYLIST_DURATION = float(os.getenv("DENYLIST_DURATION", str(7 * 24 * 3600)))  # seconds
+DENYLIST_RELOAD_INTERVAL = 600  # seconds; picks up strikes recorded by other processes
+
+metrics.describe("sniperbowl_tokens_skipped_total", "counter", "Wallet tokens left out of valuation, by reason.")
+
+unpriceable_mints = TTLCache(UNPRICEABLE_CACHE_SIZE, UNPRICEABLE_RECHECK)  # mint -> True
+
+class MintDenylist:
+    """
+    Mints that came back unpriced on DENYLIST_STRIKES separate checks are
+    skipped for DENYLIST_DURATION. Strikes live in Mongo so every process
+    learns from the others; a mint that gets a price again is cleared.
+    """
+
+    def __init__(self):
+        self.denied: dict = {}   # mint -> denied_until
+        self.struck: set = set() # mints with at least one strike
+        self.loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    async def refresh(self) -> None:
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < DENYLIST_RELOAD_INTERVAL:
+            return
+        async with self._lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < DENYLIST_RELOAD_INTERVAL:
+                return
+            denied, struck = {}, set()
+            async for doc in denylist_collection.find({}, {"denied_until": 1}):
+                struck.add(doc["_id"])
+                until = doc.get("denied_until")
+                if until is not None:
+                    denied[doc["_id"]] = until.replace(tzinfo=UTC) if until.tzinfo is None else until
+            self.denied, self.struck = denied, struck
+            self.loaded_at = time.monotonic()
+
+    def is_denied(self, mint_address: str) -> bool:
+        until = self.denied.get(mint_address)
+        return until is not None and until > datetime.now(UTC)
+
+    async def record(self, unpriced: set, priced: set) -> None:
+        """Add a strike to every unpriced mint and clear struck mints that were priced."""
+        now = datetime.now(UTC)
+        if unpriced:
+            new = [m for m in unpriced if m not in self.struck]
+            if new:
+                try:
+                    await denylist_collection.insert_many([{"_id": m, "strikes": 0} for m in new], ordered=False)
+                except BulkWriteError:
+                    pass  # struck concurrently by another process
+            await denylist_collection.update_many(
+                {"_id": {"$in": list(unpriced)}}, {"$inc": {"strikes": 1}, "$set": {"last_unpriced_at": now}}
+            )
+            self.struck.update(unpriced)
+            denied = await denylist_collection.distinct(
+                "_id", {"_id": {"$in": list(unpriced)}, "strikes": {"$gte": DENYLIST_STRIKES}}
+            )
+            if denied:
+                until = now + timedelta(seconds=DENYLIST_DURATION)
+                await denylist_collection.update_many({"_id": {"$in": denied}}, {"$set": {"denied_until": until}})
+                self.denied.update(dict.fromkeys(denied, until))
+                logger.info(f"Denylisted {len(denied)} mints that keep coming back unpriced")
+        recovered = [m for m in priced if m in self.struck]
+        if recovered:
+            await denylist_collection.delete_many({"_id": {"$in": recovered}})
+            self.struck.difference_update(recovered)
+            for mint in recovered:
+                self.denied.pop(mint, None)
+
+mint_denylist = MintDenylist()
+
+def filter_priceable(tokens: list, skipped: Counter) -> list:
+    """Tokens worth pricing; everything else is counted in `skipped` by reason."""
+    kept = []
+    for token in tokens:
+        mint = token.get("mint")
+        try:
+            amount = float(token.get("amount") or 0)
+        except (TypeError, ValueError):
+            amount = 0.0
+        if not mint or amount <= 0:
+            reason = "zero"
+        elif amount <= DUST_AMOUNT:
+            reason = "dust"
+        elif token.get("possible_spam"):
+            reason = "spam"
+        elif mint_denylist.is_denied(mint):
+            reason = "denylisted"
+        elif unpriceable_mints.get(mint):
+            reason = "unpriceable"
+        else:
+            kept.append(token)
+            continue
+        skipped[reason] += 1
+    return kept
+
+async def iter_wallet_valuations(wallet_addresses, sol_price: float, skipped: Counter | None = None):
+    """
+    Yield (wallet_address, net_worth_usd) as each wallet finishes. Holdings are
+    fetched concurrently (bounded); prices go through the shared price cache
+    and batcher, so each unique mint is priced once however many wallets hold
+    it. The first quote for a mint is kept for the rest of the run, so every
+    wallet is valued against the same price table even if the cache turns
+    over mid-run. Wallets that fail or time out yield None instead of
+    aborting the rest. Tokens dropped by filter_priceable are added to
+    `skipped` by reason.
+    """
+    semaphore = asyncio.Semaphore(VALUATION_CONCURRENCY)
+    run_skipped = Counter()
+    unpriced, priced = set(), set()
+    price_table: dict = {}  # mint -> PriceQuote, for this run
     try:
-        url = f"https://solana-gateway.moralis.io/token/mainnet/{wallet_address}/metadata"
-        headers = {
-            "Accept": "application/json",
-            "X-API-Key": API_KEY
+        await mint_denylist.refresh()
+    except Exception as e:
+        logger.warning(f"Could not reload the mint denylist: {e!r}")
+
+    async def value_one(wallet_address):
+        try:
+            async with semaphore:
+                sol_balance, tokens = await asyncio.wait_for(
+                    get_wallet_holdings(wallet_address), VALUATION_WALLET_TIMEOUT
+                )
+            tokens = filter_priceable(tokens, run_skipped)
+            mints = {t["mint"] for t in tokens}
+            for mint, price_quote in (await get_price_quotes(mints - price_table.keys())).items():
+                price_table.setdefault(mint, price_quote)
+            quotes = {mint: price_table[mint] for mint in mints}
+            for mint, price_quote in quotes.items():
+                if price_quote.source == "unpriced":
+                    unpriced.add(mint)
+                    unpriceable_mints.set(mint, True)
+                elif price_quote.price > 0 and not price_quote.age:
+                    priced.add(mint)
+            token_sol = sum(float(t["amount"]) * quotes[t["mint"]].price for t in tokens)
+            return wallet_address, (sol_balance + token_sol) * sol_price
+        except Exception as e:
+            logger.error(f"Error valuing wallet {wallet_address}: {e!r}")
+            return wallet_address, None
+
+    for next_done in asyncio.as_completed([value_one(w) for w in dict.fromkeys(wallet_addresses)]):
+        yield await next_done
+
+    for reason, count in run_skipped.items():
+        metrics.inc("sniperbowl_tokens_skipped_total", count, reason=reason)
+    if skipped is not None:
+        skipped.update(run_skipped)
+    try:
+        await mint_denylist.record(unpriced, priced)
+    except Exception as e:
+        logger.warning(f"Could not record unpriced mints: {e!r}")
+
+async def value_wallets(wallet_addresses, sol_price: float) -> dict:
+    """Net worth in USD for each wallet; wallets that could not be valued map to None."""
+    return {w: value async for w, value in iter_wallet_valuations(wallet_addresses, sol_price)}
+
+async def register_wallet(chat_id: int, user_id: int, username: str, wallet_address: str, sol_price: float) -> str:
+    """Value a new wallet and store it with that starting value. Returns a REGISTER_REPLIES key."""
+    start_usd_value = (await value_wallets([wallet_address], sol_price))[wallet_address]
+    if start_usd_value is None:
+        return "unreadable"
+    doc = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "username": username,
+        "wallet_address": wallet_address,
+        "start_usd_value": start_usd_value,
+        "created_at": datetime.now(UTC)
+    }
+    try:
+        await wallets_collection.insert_one(doc)
+    except DuplicateKeyError:
+        return "duplicate"  # registered concurrently
+    record_networth_samples(chat_id, [dict(doc, net_worth_usd=start_usd_value, pnl_usd=0.0)], doc["created_at"])
+    return "registered"
+
+async def bulk_register_wallets(chat_id: int, entries: list, sol_price: float, on_progress=None) -> dict:
+    """
+    Value and store many registrations in one pass. Every start value is taken
+    against the same SOL price and price table, and the rows go in with one
+    insert_many. `entries` are {"user_id", "username", "wallet_address"} dicts;
+    `on_progress(done, total)` is awaited as wallets finish. Returns the
+    entries per REGISTER_REPLIES outcome.
+    """
+    by_wallet = {e["wallet_address"]: e for e in entries}
+    created_at = datetime.now(UTC)  # one registration time for the whole batch
+    docs, unreadable = [], []
+    done = 0
+    async for wallet_address, start_usd_value in iter_wallet_valuations(list(by_wallet), sol_price):
+        done += 1
+        entry = by_wallet[wallet_address]
+        if start_usd_value is None:
+            unreadable.append(entry)
+        else:
+            docs.append({
+                "chat_id": chat_id,
+                "user_id": entry["user_id"],
+                "username": entry["username"],
+                "wallet_address": wallet_address,
+                "start_usd_value": start_usd_value,
+                "created_at": created_at,
+            })
+        if on_progress is not None:
+            await on_progress(done, len(by_wallet))
+
+    rejected = set()
+    if docs:
+        try:
+            await wallets_collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                if error["code"] != 11000:
+                    raise
+                rejected.add(error["index"])  # registered concurrently
+    registered = [doc for i, doc in enumerate(docs) if i not in rejected]
+    record_networth_samples(
+        chat_id, [dict(doc, net_worth_usd=doc["start_usd_value"], pnl_usd=0.0) for doc in registered], created_at
+    )
+    return {
+        "registered": [by_wallet[doc["wallet_address"]] for doc in registered],
+        "unreadable": unreadable,
+        "duplicate": [by_wallet[docs[i]["wallet_address"]] for i in sorted(rejected)],
+    }
+
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "300"))  # seconds
+LEADERBOARD_SIZE = 10
+
+_leaderboard_refreshes: dict = {}  # chat_id -> (priority, in-flight refresh task)
+
+async def build_leaderboard_snapshot(chat_id: int, all_wallets: list, sol_price: float, on_progress=None) -> dict:
+    """
+    Value every wallet in the chat and store the ranked standings.
+    `on_progress(top, done, total, failed)` is awaited after each wallet with
+    the running top ten, which is kept in a bounded heap rather than re-sorted.
+    """
+    wallets_by_address = {w["wallet_address"]: w for w in all_wallets}
+    standings = []
+    failed = []
+    skipped = Counter()
+    top = []  # min-heap of (pnl_usd, seq, item), at most LEADERBOARD_SIZE long
+    done = 0
+    async for wallet_address, total_usd in iter_wallet_valuations(wallets_by_address, sol_price, skipped):
+        w = wallets_by_address[wallet_address]
+        done += 1
+        if total_usd is None:
+            failed.append({"username": w["username"], "wallet_address": wallet_address})
+        else:
+            item = {
+                "user_id": w["user_id"],
+                "username": w["username"],
+                "wallet_address": wallet_address,
+                "net_worth_usd": total_usd,
+                "pnl_usd": total_usd - w["start_usd_value"]
+            }
+            standings.append(item)
+            entry = (item["pnl_usd"], done, item)
+            if len(top) < LEADERBOARD_SIZE:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+        if on_progress is not None:
+            running = [entry[2] for entry in sorted(top, reverse=True)]
+            await on_progress(running, done, len(wallets_by_address), failed)
+
+    standings.sort(key=lambda x: x["pnl_usd"], reverse=True)
+    for rank, item in enumerate(standings, start=1):
+        item["rank"] = rank
+
+    computed_at = datetime.now(UTC)
+    record_networth_samples(chat_id, standings, computed_at)
+    snapshot = {
+        "chat_id": chat_id,
+        "computed_at": computed_at,
+        "sol_price": sol_price,
+        "standings": standings,
+        "failed_wallets": failed,
+        "skipped_tokens": dict(skipped),
+    }
+    await snapshots_collection.insert_one(snapshot)
+    logger.info(
+        f"Leaderboard snapshot for chat {chat_id} stored; skipped {sum(skipped.values())} tokens "
+        f"{dict(skipped)}; price cache {price_cache.stats()}"
+    )
+    return snapshot
+
+async def refresh_chat_leaderboard(chat_id: int, all_wallets: list, sol_price: float, on_progress=None) -> dict:
+    """
+    Recompute a chat's snapshot, sharing the work with any refresh already
+    running at the caller's request_priority or better (in which case only
+    the original caller sees progress). An interactive refresh never waits on
+    a background one; it starts its own.
+    """
+    priority, task = _leaderboard_refreshes.get(chat_id, (None, None))
+    if task is None or priority > request_priority.get():
+        task = asyncio.ensure_future(build_leaderboard_snapshot(chat_id, all_wallets, sol_price, on_progress))
+        _leaderboard_refreshes[chat_id] = (request_priority.get(), task)
+        task.add_done_callback(functools.partial(_on_leaderboard_refreshed, chat_id))
+    return await asyncio.shield(task)
+
+def _on_leaderboard_refreshed(chat_id: int, task: asyncio.Task) -> None:
+    if _leaderboard_refreshes.get(chat_id, (None, None))[1] is task:
+        del _leaderboard_refreshes[chat_id]  # not a newer, more urgent refresh for the same chat
+
+async def latest_leaderboard_snapshot(chat_id: int) -> dict | None:
+    return await snapshots_collection.find_one(
+        {"chat_id": chat_id},
+        {"computed_at": 1, "failed_wallets": 1, "standings": {"$slice": LEADERBOARD_SIZE}},
+        sort=[("computed_at", -1)],
+    )
+
+async def refresh_leaderboard_snapshots_job(context: ContextTypes.DEFAULT_TYPE):
+    request_priority.set(PRIORITY_BACKGROUND)  # yield Moralis quota to interactive commands
+    sol_price = sol_ticker.current()
+    if sol_price <= 0:
+        logger.warning("Skipping leaderboard refresh: no usable SOL price")
+        return
+    for chat_id in await wallets_collection.distinct("chat_id"):
+        if VALUATION_MODE == "queue":
+            await enqueue_job("leaderboard", chat_id, f"leaderboard:{chat_id}", PRIORITY_BACKGROUND)
+            continue
+        all_wallets = await find_chat_wallets(chat_id)
+        try:
+            await refresh_chat_leaderboard(chat_id, all_wallets, sol_price)
+        except Exception as e:
+            logger.error(f"Error refreshing leaderboard for chat {chat_id}: {e}")
+
+def format_leaderboard(standings: list, status: str, failed: list = ()) -> str:
+    result_text = "🏆 *Sniper Bowl Leaderboard:* 🏆\n"
+    result_text += f"_{status}_\n\n"
+    for rank, item in enumerate(standings[:LEADERBOARD_SIZE], start=1):
+        sign = "+" if item["pnl_usd"] >= 0 else "-"
+        abs_pnl = abs(item["pnl_usd"])
+        result_text += (
+            f"{item.get('rank', rank)}. {item['username']} (Wallet: `{item['wallet_address']}`)\n"
+            f"   Net Worth: ${item['net_worth_usd']:.2f}\n"
+            f"   PnL: {sign}${abs_pnl:,.2f}\n\n"
+        )
+    if failed:
+        # Snapshots written before streaming stored bare wallet addresses here
+        names = (f["username"] if isinstance(f, dict) else f for f in failed)
+        result_text += "⚠️ Could not value: " + ", ".join(names) + "\n"
+    return result_text
+
+def format_age(computed_at: datetime) -> str:
+    if computed_at.tzinfo is None:  # PyMongo hands back naive UTC datetimes
+        computed_at = computed_at.replace(tzinfo=UTC)
+    seconds = int((datetime.now(UTC) - computed_at).total_seconds())
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60}m ago"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m ago"
+
+# ------------ Global leaderboard ------------
+# Standings across every chat are computed inside MongoDB: picks and cached
+# wallet holdings are $lookup-joined against latest_prices (the last fresh
+# quote per mint, see record_price_sample), grouped per user and cut to the
+# top N on the server, so the bot only ever receives N rows per board.
+GLOBAL_LEADERBOARD_TTL = float(os.getenv("GLOBAL_LEADERBOARD_TTL", "60"))            # seconds a computed board is reused
+PICK_PRICE_REFRESH_INTERVAL = float(os.getenv("PICK_PRICE_REFRESH_INTERVAL", "900"))  # seconds
+
+global_leaderboard_cache = TTLCache(1, GLOBAL_LEADERBOARD_TTL)
+
+def _to_double(path: str) -> dict:
+    # Moralis reports token amounts as strings
+    return {"$convert": {"input": path, "to": "double", "onError": 0.0, "onNull": 0.0}}
+
+def global_picks_pipeline(sol_price: float, limit: int) -> list:
+    return [
+        {"$lookup": {
+            "from": latest_prices_collection.name,
+            "localField": "mint_address",
+            "foreignField": "_id",
+            "as": "latest",
+        }},
+        {"$unwind": "$latest"},  # unpriced picks are skipped, as in /my_calls
+        {"$group": {
+            "_id": "$user_id",
+            "username": {"$last": "$username"},
+            "picks": {"$sum": 1},
+            "cost_basis_usd": {"$sum": "$cost_basis_usd"},
+            "value_sol": {"$sum": {"$multiply": ["$num_tokens", "$latest.price"]}},
+        }},
+        {"$project": {
+            "username": 1,
+            "picks": 1,
+            "pnl_usd": {"$subtract": [{"$multiply": ["$value_sol", sol_price]}, "$cost_basis_usd"]},
+        }},
+        {"$sort": {"pnl_usd": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+
+def global_wallets_pipeline(sol_price: float, limit: int, denied_mints: list = ()) -> list:
+    return [
+        # A wallet registered in several chats counts once, from its first registration
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "wallet_address": "$wallet_address"},
+            "username": {"$last": "$username"},
+            "start_usd_value": {"$first": "$start_usd_value"},
+        }},
+        # Holdings as of the wallet's last valuation; never-valued wallets drop out
+        {"$lookup": {
+            "from": holdings_collection.name,
+            "localField": "_id.wallet_address",
+            "foreignField": "_id",
+            "as": "holdings",
+        }},
+        {"$unwind": "$holdings"},
+        # Same pre-filter as filter_priceable, so a wallet is worth the same here as
+        # in its chat's snapshot. Filtering the array keeps wallets left with SOL only
+        {"$set": {"holdings.tokens": {"$filter": {
+            "input": {"$ifNull": ["$holdings.tokens", []]},
+            "as": "token",
+            "cond": {"$and": [
+                {"$gt": [_to_double("$$token.amount"), DUST_AMOUNT]},
+                {"$ne": ["$$token.possible_spam", True]},
+                {"$not": [{"$in": ["$$token.mint", list(denied_mints)]}]},
+            ]},
+        }}}},
+        {"$unwind": {"path": "$holdings.tokens", "preserveNullAndEmptyArrays": True}},
+        {"$lookup": {
+            "from": latest_prices_collection.name,
+            "localField": "holdings.tokens.mint",
+            "foreignField": "_id",
+            "as": "latest",
+        }},
+        {"$group": {
+            "_id": "$_id",
+            "username": {"$first": "$username"},
+            "start_usd_value": {"$first": "$start_usd_value"},
+            "sol_balance": {"$first": "$holdings.sol_balance"},
+            "token_sol": {"$sum": {"$multiply": [
+                _to_double("$holdings.tokens.amount"),
+                {"$ifNull": [{"$arrayElemAt": ["$latest.price", 0]}, 0.0]},  # unpriced tokens count as 0
+            ]}},
+        }},
+        {"$group": {
+            "_id": "$_id.user_id",
+            "username": {"$last": "$username"},
+            "wallets": {"$sum": 1},
+            "start_usd_value": {"$sum": "$start_usd_value"},
+            "value_sol": {"$sum": {"$add": ["$sol_balance", "$token_sol"]}},
+        }},
+        {"$project": {
+            "username": 1,
+            "wallets": 1,
+            "net_worth_usd": {"$multiply": ["$value_sol", sol_price]},
+            "pnl_usd": {"$subtract": [{"$multiply": ["$value_sol", sol_price]}, "$start_usd_value"]},
+        }},
+        {"$sort": {"pnl_usd": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+
+async def compute_global_leaderboard(sol_price: float) -> dict:
+    await mint_denylist.refresh()
+    denied = [mint for mint in mint_denylist.denied if mint_denylist.is_denied(mint)]
+    picks, wallets = await asyncio.gather(
+        picks_collection.aggregate(global_picks_pipeline(sol_price, LEADERBOARD_SIZE), allowDiskUse=True).to_list(None),
+        wallets_collection.aggregate(
+            global_wallets_pipeline(sol_price, LEADERBOARD_SIZE, denied), allowDiskUse=True
+        ).to_list(None),
+    )
+    return {"picks": picks, "wallets": wallets, "computed_at": datetime.now(UTC)}
+
+async def get_global_leaderboard(sol_price: float) -> dict:
+    """Top pickers and wallets across all chats; concurrent callers share one computation."""
+    return await global_leaderboard_cache.get_or_fetch("global", lambda _: compute_global_leaderboard(sol_price))
+
+async def refresh_pick_prices_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Price every picked mint now and then, so latest_prices covers picks nobody
+    has looked at lately. Mints are streamed from the server a batch at a time.
+    """
+    request_priority.set(PRIORITY_BACKGROUND)
+    batch = []
+    try:
+        async for row in picks_collection.aggregate([{"$group": {"_id": "$mint_address"}}], allowDiskUse=True):
+            if mint_denylist.is_denied(row["_id"]):
+                continue
+            batch.append(row["_id"])
+            if len(batch) >= MORALIS_PRICE_BATCH_SIZE:
+                await get_price_quotes(batch)
+                batch = []
+        if batch:
+            await get_price_quotes(batch)
+    except Exception as e:
+        logger.error(f"Error refreshing pick prices: {e!r}")
+
+def format_global_leaderboard(board: dict) -> str:
+    result_text = "🌍 *Global Sniper Bowl Leaderboard:* 🌍\n"
+    result_text += f"_Updated {format_age(board['computed_at'])}, across all groups_\n\n"
+    result_text += "*Top Pickers*\n"
+    for rank, item in enumerate(board["picks"], start=1):
+        sign = "+" if item["pnl_usd"] >= 0 else "-"
+        result_text += f"{rank}. {item['username']} ({item['picks']} picks): {sign}${abs(item['pnl_usd']):,.2f}\n"
+    if not board["picks"]:
+        result_text += "No priced picks yet.\n"
+    result_text += "\n*Top Wallets*\n"
+    for rank, item in enumerate(board["wallets"], start=1):
+        sign = "+" if item["pnl_usd"] >= 0 else "-"
+        result_text += (
+            f"{rank}. {item['username']}\n"
+            f"   Net Worth: ${item['net_worth_usd']:.2f}\n"
+            f"   PnL: {sign}${abs(item['pnl_usd']):,.2f}\n"
+        )
+    if not board["wallets"]:
+        result_text += "No valued wallets yet.\n"
+    return result_text
+
+# ==========================================
+# 7. Price & Net Worth History
+# ==========================================
+# Fresh prices from the oracle and the net worths each leaderboard refresh
+# computes are appended to time-series collections. An hourly job rolls raw
+# samples up into hourly closes; both tiers expire (HISTORY_*_RETENTION), so
+# storage stays bounded while "what was it at noon" stays answerable.
+PRICE_SAMPLE_INTERVAL = float(os.getenv("PRICE_SAMPLE_INTERVAL", "60"))    # seconds; at most one sample per mint
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "10"))  # seconds samples wait to be written
+HISTORY_LOOKBACK = timedelta(seconds=float(os.getenv("HISTORY_LOOKBACK", "3600")))  # max sample age for "at T"
+HISTORY_ROLLUP_INTERVAL = 3600   # seconds
+HISTORY_MAX_ROLLUP_HOURS = 48    # hours caught up per job run
+SOL_USD_SERIES = "SOL/USD"       # price_history series holding SOL's USD price
+
+class HistoryBuffer:
+    """
+    Collects samples per collection and writes each batch with one insert_many.
+    Latest-value upserts ride along and go out as one bulk_write per collection.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._samples: dict = defaultdict(list)  # collection -> pending samples
+        self._latest: dict = defaultdict(dict)   # collection -> {_id: fields to $set}
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushing: set = set()
+
+    def add(self, collection, sample: dict) -> None:
+        self._samples[collection].append(sample)
+        self._arm()
+
+    def set_latest(self, collection, key, fields: dict) -> None:
+        """Upsert `fields` onto document `key` at the next flush; the last call per key wins."""
+        self._latest[collection][key] = fields
+        self._arm()
+
+    def _arm(self) -> None:
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        task = asyncio.ensure_future(self.flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        samples, self._samples = self._samples, defaultdict(list)
+        for collection, docs in samples.items():
+            try:
+                await collection.insert_many(docs, ordered=False)
+            except Exception as e:
+                logger.warning(f"Dropped {len(docs)} history samples for {collection.name}: {e!r}")
+        latest, self._latest = self._latest, defaultdict(dict)
+        for collection, updates in latest.items():
+            try:
+                await collection.bulk_write(
+                    [UpdateOne({"_id": key}, {"$set": fields}, upsert=True) for key, fields in updates.items()],
+                    ordered=False,
+                )
+            except Exception as e:
+                logger.warning(f"Dropped {len(updates)} latest values for {collection.name}: {e!r}")
+
+history_buffer = HistoryBuffer(HISTORY_FLUSH_INTERVAL)
+_recent_price_samples = TTLCache(PRICE_CACHE_SIZE * 2, PRICE_SAMPLE_INTERVAL)  # mint -> True
+
+def record_price_sample(series: str, price: float) -> None:
+    """
+    Append a price (SOL per token, or USD for SOL_USD_SERIES) unless one was
+    taken recently, and make it the series' entry in latest_prices.
+    """
+    if price <= 0 or _recent_price_samples.get(series):
+        return
+    _recent_price_samples.set(series, True)
+    now = datetime.now(UTC)
+    history_buffer.add(price_history_collection, {"ts": now, "mint": series, "price": price})
+    history_buffer.set_latest(latest_prices_collection, series, {"price": price, "updated_at": now})
+
+def record_networth_samples(chat_id: int, standings: list, computed_at: datetime) -> None:
+    for item in standings:
+        history_buffer.add(networth_history_collection, {
+            "ts": computed_at,
+            "wallet": {"chat_id": chat_id, "wallet_address": item["wallet_address"]},
+            "user_id": item["user_id"],
+            "username": item["username"],
+            "net_worth_usd": item["net_worth_usd"],
+            "pnl_usd": item["pnl_usd"],
+        })
+
+# Hourly rollups keep the close (last sample) of each hour, stamped with the
+# hour's end so that "latest sample at or before T" means the same in both tiers.
+HISTORY_SERIES = [
+    ("prices", lambda: (price_history_collection, price_hourly_collection), "mint", {
+        "price": {"$last": "$price"},
+        "high": {"$max": "$price"},
+        "low": {"$min": "$price"},
+    }),
+    ("networth", lambda: (networth_history_collection, networth_hourly_collection), "wallet", {
+        "user_id": {"$last": "$user_id"},
+        "username": {"$last": "$username"},
+        "net_worth_usd": {"$last": "$net_worth_usd"},
+        "pnl_usd": {"$last": "$pnl_usd"},
+    }),
+]
+
+async def roll_up_hour(raw, hourly, meta_field: str, accumulators: dict, hour_start: datetime) -> int:
+    hour_end = hour_start + timedelta(hours=1)
+    pipeline = [
+        {"$match": {"ts": {"$gte": hour_start, "$lt": hour_end}}},
+        {"$sort": {"ts": 1}},
+        {"$group": {"_id": f"${meta_field}", "samples": {"$sum": 1}, **accumulators}},
+    ]
+    docs = []
+    async for row in raw.aggregate(pipeline):
+        meta = row.pop("_id")
+        docs.append({"ts": hour_end, meta_field: meta, **row})
+    if docs:
+        await hourly.insert_many(docs, ordered=False)
+    return len(docs)
+
+async def roll_up_history_job(context: ContextTypes.DEFAULT_TYPE):
+    """Downsample every complete hour not rolled up yet, oldest first."""
+    current_hour = datetime.now(UTC).replace(minute=0, second=0, microsecond=0)
+    for name, collections, meta_field, accumulators in HISTORY_SERIES:
+        raw, hourly = collections()
+        marker = await rollups_collection.find_one({"_id": name})
+        if marker is None:
+            through = current_hour - timedelta(hours=1)
+        else:
+            through = marker["through"].replace(tzinfo=UTC)
+        through = max(through, current_hour - timedelta(hours=HISTORY_MAX_ROLLUP_HOURS))
+        while through < current_hour:
+            try:
+                count = await roll_up_hour(raw, hourly, meta_field, accumulators, through)
+            except Exception as e:
+                logger.error(f"Could not roll up {name} history for {through:%Y-%m-%d %H:00}: {e!r}")
+                break
+            through += timedelta(hours=1)
+            await rollups_collection.update_one({"_id": name}, {"$set": {"through": through}}, upsert=True)
+            logger.info(f"Rolled up {count} {name} series for the hour before {through:%Y-%m-%d %H:00} UTC")
+
+async def _latest_samples(collection, match: dict, group_key: str, at: datetime, window: timedelta) -> list:
+    """The newest sample per `group_key` taken in (at - window, at]."""
+    pipeline = [
+        {"$match": {**match, "ts": {"$lte": at, "$gt": at - window}}},
+        {"$sort": {"ts": 1}},
+        {"$group": {"_id": group_key, "doc": {"$last": "$$ROOT"}}},
+    ]
+    return [row["doc"] async for row in collection.aggregate(pipeline)]
+
+# Hourly closes are stamped with the hour's end, so they need an extra hour of window
+HOURLY_LOOKBACK = HISTORY_LOOKBACK + timedelta(hours=1)
+
+async def prices_at(series, at: datetime) -> dict:
+    """
+    Historical prices per series (mint, or SOL_USD_SERIES) as of `at`, from raw
+    samples while they are retained and hourly closes after that. Series
+    without a sample in the lookback window are left out.
+    """
+    series = list(dict.fromkeys(series))
+    rows = await _latest_samples(price_history_collection, {"mint": {"$in": series}}, "$mint", at, HISTORY_LOOKBACK)
+    prices = {row["mint"]: row["price"] for row in rows}
+    missing = [m for m in series if m not in prices]
+    if missing:
+        rows = await _latest_samples(price_hourly_collection, {"mint": {"$in": missing}}, "$mint", at, HOURLY_LOOKBACK)
+        prices.update((row["mint"], row["price"]) for row in rows)
+    return prices
+
+async def leaderboard_at(chat_id: int, at: datetime) -> list:
+    """Ranked standings for a chat from the net-worth samples taken closest before `at`."""
+    match = {"wallet.chat_id": chat_id}
+    rows = await _latest_samples(networth_history_collection, match, "$wallet.wallet_address", at, HISTORY_LOOKBACK)
+    if not rows:
+        rows = await _latest_samples(networth_hourly_collection, match, "$wallet.wallet_address", at, HOURLY_LOOKBACK)
+    standings = [
+        {
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "wallet_address": row["wallet"]["wallet_address"],
+            "net_worth_usd": row["net_worth_usd"],
+            "pnl_usd": row["pnl_usd"],
         }
-        response = requests.request("GET", url, headers=headers)
-        if response.status_code == 200:
-            return response.json().get("symbol", "N/A")
-        return "N/A"
+        for row in rows
+    ]
+    standings.sort(key=lambda x: x["pnl_usd"], reverse=True)
+    for rank, item in enumerate(standings, start=1):
+        item["rank"] = rank
+    return standings
+
+async def picks_pnl_at(chat_id: int, user_id: int, at: datetime) -> list:
+    """A user's picks made before `at`, valued at the prices recorded then. Unpriced picks are left out."""
+    picks = [
+        p for p in await find_user_picks(chat_id, user_id)
+        if p.get("created_at") is None or p["created_at"].replace(tzinfo=UTC) <= at
+    ]
+    if not picks:
+        return []
+    prices = await prices_at([p["mint_address"] for p in picks] + [SOL_USD_SERIES], at)
+    sol_price = prices.get(SOL_USD_SERIES, 0.0)
+    results = []
+    for pick in picks:
+        price_sol = prices.get(pick["mint_address"], 0.0)
+        if price_sol <= 0 or sol_price <= 0:
+            continue
+        price_usd = price_sol * sol_price
+        results.append({
+            "username": pick["username"],
+            "mint": pick["mint_address"],
+            "cost_basis_usd": pick["cost_basis_usd"],
+            "current_price_usd": price_usd,
+            "pnl": pick["num_tokens"] * price_usd - pick["cost_basis_usd"],
+        })
+    return results
+
+def parse_past_time(text: str) -> datetime | None:
+    """'90m', '3h' or '2d' ago, 'HH:MM' (UTC, the last one that has passed) or an ISO timestamp."""
+    text = text.strip()
+    now = datetime.now(UTC)
+    match = re.fullmatch(r"(\d+)([mhd])", text.lower())
+    if match:
+        unit = {"m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+        return now - timedelta(**{unit: int(match.group(1))})
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None
+        at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return at if at <= now else at - timedelta(days=1)
+    try:
+        at = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    at = at.replace(tzinfo=UTC) if at.tzinfo is None else at
+    return at if at <= now else None
+
+# ==========================================
+# 8. Wallet Tracking
+# ==========================================
+SOLANA_WS_URL = os.getenv("SOLANA_WS_URL")  # e.g. wss://api.mainnet-beta.solana.com; unset = off
+WALLET_TRACKER_HEARTBEAT = float(os.getenv("WALLET_TRACKER_HEARTBEAT", "30"))  # seconds
+WALLET_TRACKER_FLUSH_INTERVAL = 1.0  # seconds; change notifications are batched into one write
+# SPL token accounts (ATAs) are owned by the token programs, not the wallet, so
+# incoming transfers the wallet never signs only show up on these
+TOKEN_PROGRAM_IDS = (
+    "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA",  # SPL Token
+    "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb",  # Token-2022
+)
+TOKEN_ACCOUNT_OWNER_OFFSET = 32  # mint (32 bytes), then owner
+# A wallet is only watched once the node confirmed every one of these
+WALLET_SUBSCRIPTION_KINDS = ("account", "logs") + tuple(f"tokens:{p}" for p in TOKEN_PROGRAM_IDS)
+
+metrics.describe("sniperbowl_tracked_wallets", "gauge", "Wallets with live change subscriptions.")
+metrics.describe("sniperbowl_wallet_notifications_total", "counter", "Account/log notifications received.")
+
+class WalletTracker:
+    """
+    Subscribes to account and log changes for every registered wallet, plus
+    changes to any token account it owns, over a Solana RPC websocket. A
+    notification marks the wallet's cached holdings
+    dirty (and bumps their version), so only wallets that actually changed are
+    re-fetched. While connected the tracker keeps renewing `watched_until` on
+    the holdings it vouches for; if it dies, that lease lapses and valuation
+    falls back to fetching everything.
+    """
+
+    def __init__(self, url: str, heartbeat: float):
+        self.url = url
+        self.heartbeat = heartbeat
+        self._ids = itertools.count(1)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._requests: dict = {}       # request id -> (wallet, kind)
+        self._subscriptions: dict = {}  # subscription id -> wallet
+        self._confirmed = defaultdict(set)  # wallet -> subscription kinds the node confirmed
+        self._pending: set = set()      # (wallet, kind) sent and not answered yet
+        self._dirty: set = set()
+
+    @property
+    def live_wallets(self) -> list:
+        # Only wallets with every kind confirmed; a half-watched wallet must not get a lease
+        return [w for w, kinds in self._confirmed.items() if len(kinds) == len(WALLET_SUBSCRIPTION_KINDS)]
+
+    async def run(self) -> None:
+        backoff = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, max_size=None) as ws:
+                    logger.info(f"Wallet tracker connected to {self.url}")
+                    backoff = 1
+                    await self._session(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Wallet tracker disconnected: {e!r}")
+            finally:
+                await self._release()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    async def _session(self, ws) -> None:
+        reader = asyncio.ensure_future(self._read(ws))
+        try:
+            while True:
+                await self._subscribe_new(ws)
+                await self._renew()
+                for _ in range(max(1, int(self.heartbeat / WALLET_TRACKER_FLUSH_INTERVAL))):
+                    done, _ = await asyncio.wait({reader}, timeout=WALLET_TRACKER_FLUSH_INTERVAL)
+                    if done:
+                        reader.result()  # re-raise why the socket closed
+                        return
+                    await self._flush_dirty()
+        finally:
+            reader.cancel()
+
+    async def _subscribe_new(self, ws) -> None:
+        # Sends whatever is neither confirmed nor awaiting an answer, so a
+        # rejected subscription is retried on its own on the next heartbeat
+        wallets = set(await wallets_collection.distinct("wallet_address")) - set(self.live_wallets)
+        for wallet_address in wallets:
+            for kind, (method, params) in self._subscriptions_for(wallet_address).items():
+                if kind in self._confirmed[wallet_address] or (wallet_address, kind) in self._pending:
+                    continue
+                request_id = next(self._ids)
+                self._requests[request_id] = (wallet_address, kind)
+                self._pending.add((wallet_address, kind))
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}))
+
+    @staticmethod
+    def _subscriptions_for(wallet_address: str) -> dict:
+        """kind -> (method, params) for every subscription one wallet needs."""
+        owned_by_wallet = {"memcmp": {"offset": TOKEN_ACCOUNT_OWNER_OFFSET, "bytes": wallet_address}}
+        subscriptions = {
+            "account": ("accountSubscribe", [wallet_address, {"encoding": "base64", "commitment": "confirmed"}]),
+            "logs": ("logsSubscribe", [{"mentions": [wallet_address]}, {"commitment": "confirmed"}]),
+        }
+        for program_id in TOKEN_PROGRAM_IDS:
+            subscriptions[f"tokens:{program_id}"] = ("programSubscribe", [program_id, {
+                "encoding": "base64",
+                "commitment": "confirmed",
+                "filters": [owned_by_wallet],
+            }])
+        return subscriptions
+
+    async def _read(self, ws) -> None:
+        async for raw in ws:
+            message = json.loads(raw)
+            if "id" in message:
+                wallet_address, kind = self._requests.pop(message["id"], (None, None))
+                if wallet_address is None:
+                    continue
+                self._pending.discard((wallet_address, kind))
+                if "error" in message:
+                    logger.error(f"Subscription {kind} for {wallet_address} failed: {message['error']}")
+                    continue  # retried on the next heartbeat
+                self._subscriptions[message["result"]] = wallet_address
+                self._confirmed[wallet_address].add(kind)
+                if len(self._confirmed[wallet_address]) == len(WALLET_SUBSCRIPTION_KINDS):
+                    await self._on_watch_started(wallet_address)
+            elif message.get("method", "").endswith("Notification"):
+                wallet_address = self._subscriptions.get(message.get("params", {}).get("subscription"))
+                if wallet_address:
+                    metrics.inc("sniperbowl_wallet_notifications_total")
+                    self._dirty.add(wallet_address)
+
+    async def _on_watch_started(self, wallet_address: str) -> None:
+        # Anything cached before the subscriptions were live may be stale
+        await holdings_collection.update_one(
+            {"_id": wallet_address},
+            {"$set": {"dirty": True, "watched_until": self._lease()}, "$inc": {"version": 1}},
+            upsert=True,
+        )
+
+    async def _flush_dirty(self) -> None:
+        if not self._dirty:
+            return
+        dirty, self._dirty = list(self._dirty), set()
+        await holdings_collection.update_many(
+            {"_id": {"$in": dirty}},
+            {"$set": {"dirty": True}, "$inc": {"version": 1}},
+        )
+
+    async def _renew(self) -> None:
+        live = self.live_wallets
+        metrics.set("sniperbowl_tracked_wallets", len(live))
+        if live:
+            await holdings_collection.update_many(
+                {"_id": {"$in": live}},
+                {"$set": {"watched_until": self._lease()}},
+            )
+
+    def _lease(self) -> datetime:
+        return datetime.now(UTC) + timedelta(seconds=2 * self.heartbeat + WALLET_TRACKER_FLUSH_INTERVAL)
+
+    async def _release(self) -> None:
+        live = self.live_wallets
+        self._reset()
+        metrics.set("sniperbowl_tracked_wallets", 0)
+        if not live:
+            return
+        try:
+            await holdings_collection.update_many(
+                {"_id": {"$in": live}},
+                {"$set": {"dirty": True, "watched_until": datetime.now(UTC)}, "$inc": {"version": 1}},
+            )
+        except Exception as e:
+            logger.warning(f"Could not release tracked holdings: {e}")  # leases lapse on their own
+
+# ==========================================
+# 9. Job Queue
+# ==========================================
+# With VALUATION_MODE=queue the bot only enqueues valuation work in the `jobs`
+# collection. Worker processes (`python bot.py worker`, as many as needed)
+# claim jobs under a lease with find-and-modify, keep renewing it while they
+# work and write the result back; the bot posts it. A job whose lease lapses
+# (crashed or stalled worker) is claimed again, up to JOB_MAX_ATTEMPTS.
+VALUATION_MODE = os.getenv("VALUATION_MODE", "inline")  # "inline" (in the bot) or "queue" (workers)
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))                 # seconds a claim holds without renewal
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))  # seconds, worker claims and bot deliveries
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))  # jobs per worker process
+WORKER_ID = os.getenv("DYNO") or f"{socket.gethostname()}:{os.getpid()}"
+
+metrics.describe("sniperbowl_jobs_total", "counter", "Valuation jobs finished, by kind and outcome.")
+metrics.describe("sniperbowl_job_wait_seconds", "histogram", "Time valuation jobs spent queued before a claim.")
+metrics.describe("sniperbowl_jobs_reclaimed_total", "counter", "Jobs claimed again after a lease lapsed.")
+
+async def enqueue_job(kind: str, chat_id: int, dedupe_key: str, priority: int,
+                      payload: dict | None = None, notify: dict | None = None) -> bool:
+    """
+    Queue a job unless one with the same dedupe_key is already queued or
+    running; then `notify` ({chat_id, message_id} to edit with the result) is
+    added to that job instead. Returns True if a new job was queued.
+    """
+    for _ in range(2):
+        try:
+            await jobs_collection.insert_one({
+                "kind": kind,
+                "chat_id": chat_id,
+                "dedupe_key": dedupe_key,
+                "payload": payload or {},
+                "priority": priority,
+                "notify": [notify] if notify else [],
+                "status": "queued",
+                "active": True,
+                "attempts": 0,
+                "delivered": False,
+                "created_at": datetime.now(UTC),
+            })
+            return True
+        except DuplicateKeyError:
+            update = {"$min": {"priority": priority}}
+            if notify:
+                update["$push"] = {"notify": notify}
+            result = await jobs_collection.update_one({"dedupe_key": dedupe_key, "active": True}, update)
+            if result.matched_count:
+                return False
+            # it finished in between; queue a fresh one
+    return False
+
+async def claim_job(worker_id: str) -> dict | None:
+    now = datetime.now(UTC)
+    return await jobs_collection.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ],
+            "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker": worker_id,
+                "lease_until": now + timedelta(seconds=JOB_LEASE),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("priority", 1), ("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def fail_abandoned_jobs() -> None:
+    """Give up on jobs whose lease lapsed on their last attempt."""
+    now = datetime.now(UTC)
+    await jobs_collection.update_many(
+        {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}},
+        {"$set": {"status": "failed", "error": "lease expired", "finished_at": now}, "$unset": {"active": ""}},
+    )
+
+async def _update_claimed_job(job: dict, worker_id: str, update: dict) -> bool:
+    """Apply `update` only while this worker still holds the job."""
+    result = await jobs_collection.update_one(
+        {"_id": job["_id"], "worker": worker_id, "status": "running"}, update
+    )
+    return result.matched_count > 0
+
+async def run_leaderboard_job(job: dict, report) -> dict:
+    sol_price = await current_sol_price()
+    if sol_price <= 0:
+        raise RuntimeError("no usable SOL price")
+
+    async def on_progress(top, done, total, failed):
+        await report({"top": top, "done": done, "total": total, "failed": failed})
+
+    all_wallets = await find_chat_wallets(job["chat_id"])
+    snapshot = await build_leaderboard_snapshot(job["chat_id"], all_wallets, sol_price, on_progress)
+    return {"snapshot_id": snapshot["_id"]}
+
+async def run_register_job(job: dict, report) -> dict:
+    sol_price = await current_sol_price()
+    if sol_price <= 0:
+        raise RuntimeError("no usable SOL price")
+    payload = job["payload"]
+    outcome = await register_wallet(
+        job["chat_id"], payload["user_id"], payload["username"], payload["wallet_address"], sol_price
+    )
+    return {"outcome": outcome}
+
+JOB_HANDLERS = {
+    "leaderboard": run_leaderboard_job,
+    "register": run_register_job,
+}
+
+async def process_job(job: dict, worker_id: str) -> None:
+    kind = job["kind"]
+    current_handler.set(f"{kind}_job")
+    request_priority.set(job["priority"])
+    if job["attempts"] > 1:
+        metrics.inc("sniperbowl_jobs_reclaimed_total", kind=kind)
+    else:
+        created_at = job["created_at"].replace(tzinfo=UTC) if job["created_at"].tzinfo is None else job["created_at"]
+        metrics.observe("sniperbowl_job_wait_seconds", (datetime.now(UTC) - created_at).total_seconds(), kind=kind)
+
+    def lease():
+        return {"lease_until": datetime.now(UTC) + timedelta(seconds=JOB_LEASE)}
+
+    async def renew():
+        while True:
+            await asyncio.sleep(JOB_LEASE / 3)
+            try:
+                if not await _update_claimed_job(job, worker_id, {"$set": lease()}):
+                    return  # reclaimed by another worker
+            except Exception as e:
+                logger.warning(f"Could not renew lease on job {job['_id']}: {e!r}")
+
+    last_report = 0.0
+
+    async def report(progress: dict) -> None:
+        nonlocal last_report
+        if progress["done"] < progress["total"] and time.monotonic() - last_report < LEADERBOARD_EDIT_INTERVAL:
+            return
+        last_report = time.monotonic()
+        await _update_claimed_job(job, worker_id, {"$set": {"progress": progress, "progress_posted": False, **lease()}})
+
+    work = asyncio.ensure_future(JOB_HANDLERS[kind](job, report))
+    renewer = asyncio.ensure_future(renew())
+    try:
+        done, _ = await asyncio.wait({work, renewer}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        work.cancel()
+        renewer.cancel()
+    if work not in done:
+        logger.warning(f"Lost the lease on {kind} job {job['_id']}; dropping it")
+        return
+
+    now = datetime.now(UTC)
+    try:
+        result = work.result()
     except Exception as e:
-        logger.error(f"Error fetching token metadata for {wallet_address}: {e}")
-        return "N/A"
+        logger.error(f"{kind} job {job['_id']} failed (attempt {job['attempts']}): {e!r}")
+        if job["attempts"] < JOB_MAX_ATTEMPTS:
+            await _update_claimed_job(job, worker_id, {
+                "$set": {"status": "queued", "error": repr(e)}, "$unset": {"worker": "", "lease_until": ""}
+            })
+            return
+        await _update_claimed_job(job, worker_id, {
+            "$set": {"status": "failed", "error": repr(e), "finished_at": now}, "$unset": {"active": ""}
+        })
+        metrics.inc("sniperbowl_jobs_total", kind=kind, outcome="failed")
+        return
+    await _update_claimed_job(job, worker_id, {
+        "$set": {"status": "done", "result": result, "finished_at": now}, "$unset": {"active": ""}
+    })
+    metrics.inc("sniperbowl_jobs_total", kind=kind, outcome="done")
+
+async def run_worker(worker_id: str = WORKER_ID) -> None:
+    """Claim and process jobs forever, at most JOB_WORKER_CONCURRENCY at a time."""
+    logger.info(f"Valuation worker {worker_id} started")
+    slots = asyncio.Semaphore(JOB_WORKER_CONCURRENCY)
+    running: set = set()
 
+    def release(task):
+        running.discard(task)
+        slots.release()
+
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                job = await claim_job(worker_id)
+                if job is None:
+                    await fail_abandoned_jobs()
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e!r}")
+                job = None
+            if job is None:
+                slots.release()
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            task = asyncio.create_task(process_job(job, worker_id))
+            running.add(task)
+            task.add_done_callback(release)
+    finally:
+        for task in running:
+            task.cancel()
+        # Hand unfinished jobs straight back instead of waiting for their leases to lapse
+        await jobs_collection.update_many(
+            {"worker": worker_id, "status": "running"},
+            {"$set": {"status": "queued"}, "$unset": {"worker": "", "lease_until": ""}, "$inc": {"attempts": -1}},
+        )
 
 # ==========================================
-# 5. Bot Handlers
+# 10. Bot Handlers
 # ==========================================
 
+async def is_chat_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    chat = update.effective_chat
+    if chat.type == Chat.PRIVATE:
+        return True
+    member = await context.bot.get_chat_member(chat.id, update.effective_user.id)
+    return member.status in (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
 # ------------ HELP & START ------------
+@instrumented_handler
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /start - Simplified welcome message with emojis.
@@ -165,6 +2478,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(welcome_text, parse_mode="Markdown")
 
+@instrumented_handler
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /help - Shows usage and commands with emojis.
@@ -175,10 +2489,15 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• /register\\_wallet – Register your fresh wallet with only your contest trading amount for a Sniper Bowl in it \\(Rebuy as many times as you like\\)\n\n"
         "\\(Function 2\\)\n\n"
         "• /sniper\\_leaderboard – Shows the Sniper Bowl leaderboard for the contest \\(wallet\\-based\\. The team wonky will post the leaderboard during competitions\\)\n"
+        "• /sniper\\_leaderboard refresh – Recalculate the leaderboard right now \\(group admins only\\)\n"
+        "• /leaderboard\\_at 3h – The leaderboard as it stood 3 hours ago \\(also 12:00 or an ISO date, UTC\\)\n"
+        "• /global\\_leaderboard – Top pickers and wallets across every group\n"
+        "• /bulk\\_register – Register many `user_id,username,wallet` rows at once, inline or as a CSV file caption \\(group admins only\\)\n"
         # "• /share – Share your CA picks on Twitter\n\n"
     )
     await update.message.reply_text(help_text, parse_mode="MarkdownV2")
 
+@instrumented_handler
 async def rule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     rule_text = (
         "🎯 *RULES*\n\n"
@@ -194,28 +2513,53 @@ async def rule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(rule_text, parse_mode="MarkdownV2")
 
 # ------------ FUNCTION 1: SHILLING CAs ------------
+@instrumented_handler
 async def leader_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /my_calls - Your picks at current prices.
+    /my_calls <when> - Your picks at the prices recorded then (e.g. 3h, 12:00).
+    """
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
-    sol_price = get_sol_price()
+    if context.args:
+        at = parse_past_time(" ".join(context.args))
+        if at is None:
+            await update.message.reply_text("❌ Could not read that time. Try e.g. /my_calls 3h, /my_calls 12:00 or an ISO date (UTC).")
+            return
+        data_list = await picks_pnl_at(chat_id, user_id, at)
+        if not data_list:
+            await update.message.reply_text("No picks with recorded prices at that time.")
+            return
+        metadata = await get_token_metadata_many([item["mint"] for item in data_list])
+        for item in data_list:
+            item["tiker"] = ticker_of(metadata.get(item["mint"]))
+        await update.message.reply_text(
+            format_picks(data_list, f"🏆 *Your Picks Leaderboard:* 🏆\n_As of {at:%Y-%m-%d %H:%M} UTC_"),
+            parse_mode="Markdown",
+        )
+        return
+
+    sol_price = await current_sol_price()
     if sol_price <= 0:
         await update.message.reply_text("❌ Could not fetch SOL price. Leaderboard unavailable.")
         return
 
-    all_picks = list(picks_collection.find({"chat_id": chat_id}))
-    if not all_picks:
+    user_picks = await find_user_picks(chat_id, user_id)
+    if not user_picks:
         await update.message.reply_text("No CA picks found. Paste a CA to add your first pick!")
         return
 
+    mints = [p["mint_address"] for p in user_picks]
+    metadata, quotes = await asyncio.gather(get_token_metadata_many(mints), get_price_quotes(mints))
+
     data_list = []
-    for pick in all_picks:
+    for pick in user_picks:
         mint = pick["mint_address"]
         cost_basis_usd = pick["cost_basis_usd"]
         num_tokens = pick["num_tokens"]
-        username = pick["username"]
-        pick_user_id=pick["user_id"]
 
-        current_close_sol = get_latest_close_price_in_sol(mint)
+        quote = quotes[mint]
+        current_close_sol = quote.price
         if current_close_sol <= 0:
             continue  # Skip tokens with invalid prices
 
@@ -223,22 +2567,25 @@ async def leader_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         current_value_usd = num_tokens * current_token_price_usd
         pnl = current_value_usd - cost_basis_usd
 
-        if(pick_user_id==user_id):
-            data_list.append({
-                "username": username,
-                "tiker": get_tiker(mint),
-                "mint": mint,
-                "cost_basis_usd": cost_basis_usd,
-                "current_price_usd": current_token_price_usd,
-                "pnl": pnl
-            })
+        data_list.append({
+            "username": pick["username"],
+            "tiker": ticker_of(metadata.get(mint)),
+            "mint": mint,
+            "cost_basis_usd": cost_basis_usd,
+            "current_price_usd": current_token_price_usd,
+            "pnl": pnl,
+            "price_age": quote.age,
+        })
 
     if not data_list:
         await update.message.reply_text("No valid picks found with current price data.")
         return
 
+    await update.message.reply_text(format_picks(data_list, "🏆 *Your Picks Leaderboard:* 🏆"), parse_mode="Markdown")
+
+def format_picks(data_list: list, title: str) -> str:
     data_list.sort(key=lambda x: x["pnl"], reverse=True)
-    result_text = "🏆 *Your Picks Leaderboard:* 🏆\n\n"
+    result_text = f"{title}\n\n"
     for rank, item in enumerate(data_list[:10], start=1):
         sign = "+" if item["pnl"] >= 0 else "-"
         abs_pnl = abs(item["pnl"])
@@ -248,14 +2595,18 @@ async def leader_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f" Mint:`{item['mint']}`\n"
             f" PnL: {sign}${abs_pnl:,.2f}\n"
             f" Entry(0.5 SOL in USD): ${item['cost_basis_usd']:.2f}\n"
-            f" Current Token Price: ${item['current_price_usd']:.8f}\n\n"
+            f" Current Token Price: ${item['current_price_usd']:.8f}"
         )
-
-    await update.message.reply_text(result_text, parse_mode="Markdown")
+        if item.get("price_age"):
+            stale_since = datetime.now(UTC) - timedelta(seconds=item["price_age"])
+            result_text += f" (last known, {format_age(stale_since)})"
+        result_text += "\n\n"
+    return result_text
 
 # ------------ FUNCTION 2: SNIPER BOWL ------------
 WALLET_ADDRESS = 0
 
+@instrumented_handler
 async def register_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the wallet registration process."""
     await update.message.reply_text(
@@ -263,6 +2614,7 @@ async def register_wallet_command(update: Update, context: ContextTypes.DEFAULT_
     )
     return WALLET_ADDRESS
 
+@instrumented_handler
 async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the wallet address input."""
     if not update.message or not update.message.text:
@@ -276,122 +2628,368 @@ async def handle_wallet_address(update: Update, context: ContextTypes.DEFAULT_TY
     if not is_valid_solana_address(wallet_address):
         await update.message.reply_text("❌ Invalid Solana address. Please try again with /register_wallet")
         return ConversationHandler.END
-    existing = wallets_collection.find_one({"chat_id": chat_id, "wallet_address": wallet_address})
+    existing = await wallets_collection.find_one({"chat_id": chat_id, "wallet_address": wallet_address}, {"_id": 1})
     if existing:
         await update.message.reply_text("🎯 This wallet is already registered in this group.")
         return ConversationHandler.END
-    register_existing = wallets_collection.find_one({"chat_id": chat_id, "user_id": user_id})
+    register_existing = await wallets_collection.find_one({"chat_id": chat_id, "user_id": user_id}, {"_id": 1})
     if register_existing:
         await update.message.reply_text("🎯 You already registered your wallet.")
         return ConversationHandler.END
 
-    sol_price = get_sol_price()
-    sol_balance = get_sol_balance(wallet_address)
+    if VALUATION_MODE == "queue":
+        placeholder = await update.message.reply_text("🎯 Checking your wallet, you'll get an answer here shortly.")
+        queued = await enqueue_job(
+            "register", chat_id, f"register:{chat_id}:{user_id}", PRIORITY_INTERACTIVE,
+            payload={"user_id": user_id, "username": username, "wallet_address": wallet_address},
+            notify={"chat_id": chat_id, "message_id": placeholder.message_id},
+        )
+        if not queued:
+            await placeholder.edit_text("🎯 Your registration is already being processed.")
+        return ConversationHandler.END
+
+    sol_price = await current_sol_price()
     if sol_price <= 0:
         await update.message.reply_text("❌ Could not fetch SOL price. Try again later.")
         return ConversationHandler.END
     
     # await update.message.reply_text("🎯 Oh, you think you a Sniper Bowl All Star. Okay, your results are being tallied and will be posted to you shortly.")
 
-    balances = get_wallet_balances(wallet_address)
-
-    total_usd = 0.0
-    for token_info in balances:
-        token_price = get_latest_close_price_in_sol(token_info.get("mint")) * sol_price
-        token_balance = float(token_info.get("amount", 0))
-        total_usd += token_balance * token_price
-
-    start_usd_value = sol_balance * sol_price + total_usd
-
-    doc = {
-        "chat_id": chat_id,
-        "user_id": user_id,
-        "username": username,
-        "wallet_address": wallet_address,
-        "start_usd_value": start_usd_value,
-        "created_at": datetime.now(UTC)
-    }
     try:
-        wallets_collection.insert_one(doc)
-        await update.message.reply_text(
-            "✅ Successfully registered your wallet"
-        )
-
+        outcome = await register_wallet(chat_id, user_id, username, wallet_address, sol_price)
+        await update.message.reply_text(REGISTER_REPLIES[outcome])
     except Exception as e:
         logger.error(f"Error registering wallet: {e}")
         await update.message.reply_text("❌ Could not register wallet. Please try again later.")
     
     return ConversationHandler.END
 
-async def sniper_leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+REGISTER_REPLIES = {
+    "registered": "✅ Successfully registered your wallet",
+    "unreadable": "❌ Could not read this wallet's balances. Try again later.",
+    "duplicate": "🎯 You already registered your wallet.",
+}
+
+BULK_REGISTER_MAX_ROWS = int(os.getenv("BULK_REGISTER_MAX_ROWS", "1000"))
+BULK_REGISTER_MAX_BYTES = 512 * 1024  # CSV uploads larger than this are refused unread
+BULK_REPORT_MAX_LINES = 20            # rejected rows listed in the summary
+
+def parse_bulk_registrations(text: str) -> tuple:
+    """
+    Validate `user_id,username,wallet_address` rows in one pass. Returns
+    (entries, rejected) where rejected is [(line number, wallet, reason)].
+    A header row is skipped; users and wallets repeated in the upload are
+    rejected after their first row.
+    """
+    entries, rejected = [], []
+    seen_users, seen_wallets = set(), set()
+    for line_no, row in enumerate(csv.reader(text.splitlines()), start=1):
+        row = [field.strip() for field in row]
+        if not any(row):
+            continue
+        if len(row) != 3:
+            rejected.append((line_no, "", "expected `user_id,username,wallet_address`"))
+            continue
+        user_id, username, wallet_address = row
+        if not user_id.lstrip("-").isdigit():
+            if line_no > 1:  # anything but a header row
+                rejected.append((line_no, wallet_address, "`user_id` must be a number"))
+            continue
+        if not is_valid_solana_address(wallet_address):
+            rejected.append((line_no, wallet_address, "invalid Solana address"))
+            continue
+        if int(user_id) in seen_users or wallet_address in seen_wallets:
+            rejected.append((line_no, wallet_address, "repeated in this upload"))
+            continue
+        seen_users.add(int(user_id))
+        seen_wallets.add(wallet_address)
+        entries.append({
+            "line": line_no,
+            "user_id": int(user_id),
+            "username": username.lstrip("@") or "Anonymous",
+            "wallet_address": wallet_address,
+        })
+    return entries, rejected
+
+def format_bulk_report(result: dict, rejected: list, sol_price: float) -> str:
+    result_text = f"✅ Registered {len(result['registered'])} wallets at SOL ${sol_price:,.2f}\n"
+    skipped = sorted(rejected + [
+        (entry["line"], entry["wallet_address"], reason)
+        for outcome, reason in (("unreadable", "could not read balances"), ("duplicate", "registered meanwhile"))
+        for entry in result[outcome]
+    ])
+    if skipped:
+        result_text += f"⚠️ Skipped {len(skipped)}:\n"
+        for line_no, wallet_address, reason in skipped[:BULK_REPORT_MAX_LINES]:
+            wallet = f" `{wallet_address}`" if wallet_address else ""
+            result_text += f"• line {line_no}{wallet}: {reason}\n"
+        if len(skipped) > BULK_REPORT_MAX_LINES:
+            result_text += f"…and {len(skipped) - BULK_REPORT_MAX_LINES} more\n"
+    return result_text
+
+@instrumented_handler
+async def bulk_register_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /bulk_register - Register many wallets at once (group admins only). Rows
+    are `user_id,username,wallet_address`, either on the lines after the
+    command or in a CSV document captioned /bulk_register (or replied to).
+    """
+    if not await is_chat_admin(update, context):
+        await update.message.reply_text("❌ Only group admins can bulk register wallets.")
+        return
+    message = update.message
     chat_id = update.effective_chat.id
-    sol_price = get_sol_price()
-    if sol_price <= 0:
-        await update.message.reply_text("❌ Could not fetch SOL price. Leaderboard unavailable.")
+    document = message.document or (message.reply_to_message and message.reply_to_message.document)
+    if document:
+        if (document.file_size or 0) > BULK_REGISTER_MAX_BYTES:
+            await message.reply_text(f"❌ That file is too large (max {BULK_REGISTER_MAX_BYTES // 1024} KB).")
+            return
+        file = await document.get_file()
+        text = (await file.download_as_bytearray()).decode("utf-8-sig", errors="replace")
+    else:
+        parts = (message.text or "").split(maxsplit=1)
+        text = parts[1] if len(parts) > 1 else ""
+    if not text.strip():
+        await message.reply_text(
+            "Usage: /bulk_register followed by one `user_id,username,wallet_address` per line, "
+            "or send a CSV file with /bulk_register as its caption.",
+            parse_mode="Markdown",
+        )
         return
 
-    all_wallets = list(wallets_collection.find({"chat_id": chat_id}))
-    if not all_wallets:
-        await update.message.reply_text("No wallets here. Use /register_wallet <address> to join!")
+    entries, rejected = parse_bulk_registrations(text)
+    if len(entries) > BULK_REGISTER_MAX_ROWS:
+        await message.reply_text(f"❌ Too many rows ({len(entries)}); the limit is {BULK_REGISTER_MAX_ROWS} per upload.")
+        return
+    if entries:
+        # One query for every user and wallet already registered here
+        existing = await wallets_collection.find(
+            {"chat_id": chat_id, "$or": [
+                {"user_id": {"$in": [e["user_id"] for e in entries]}},
+                {"wallet_address": {"$in": [e["wallet_address"] for e in entries]}},
+            ]},
+            {"_id": 0, "user_id": 1, "wallet_address": 1},
+        ).to_list(None)
+        taken_users = {w["user_id"] for w in existing}
+        taken_wallets = {w["wallet_address"] for w in existing}
+        fresh = []
+        for entry in entries:
+            if entry["user_id"] in taken_users or entry["wallet_address"] in taken_wallets:
+                rejected.append((entry["line"], entry["wallet_address"], "already registered here"))
+            else:
+                fresh.append(entry)
+        entries = fresh
+
+    sol_price = await current_sol_price()
+    if sol_price <= 0:
+        await message.reply_text("❌ Could not fetch SOL price. Try again later.")
+        return
+    if not entries:
+        await message.reply_text(format_bulk_report({"registered": [], "unreadable": [], "duplicate": []}, rejected, sol_price), parse_mode="Markdown")
         return
 
-    await update.message.reply_text("🎯 Oh, you think you a Sniper Bowl All Star. Okay, your results are being tallied and will be posted to you shortly.")
+    placeholder = await message.reply_text(f"🎯 Valuing {len(entries)} wallets…")
+    progress = LeaderboardProgress(placeholder)
 
-    results = []
+    async def on_progress(done, total):
+        await progress.report(f"🎯 Valuing wallets… {done}/{total}", done, total)
 
-    for w in all_wallets:
-        user_name = w["username"]
-        wallet_address = w["wallet_address"]
-        start_usd_value = w["start_usd_value"]
+    # Reset afterwards: the update processor may run this chat's next update in the same task
+    token = request_priority.set(PRIORITY_BACKGROUND)  # leave Moralis quota to interactive commands
+    try:
+        result = await bulk_register_wallets(chat_id, entries, sol_price, on_progress)
+    except Exception as e:
+        logger.error(f"Error bulk registering wallets: {e!r}")
+        await progress.finish("❌ Could not register the wallets. Please try again later.")
+        return
+    finally:
+        request_priority.reset(token)
+    logger.info(
+        f"Bulk registered {len(result['registered'])} wallets in chat {chat_id}; "
+        f"{len(rejected) + len(result['unreadable']) + len(result['duplicate'])} skipped"
+    )
+    await progress.finish(format_bulk_report(result, rejected, sol_price))
 
-        balances = get_wallet_balances(wallet_address)
-        sol_balance = get_sol_balance(wallet_address)
+LEADERBOARD_EDIT_INTERVAL = float(os.getenv("LEADERBOARD_EDIT_INTERVAL", "3"))  # seconds between edits
 
-        total_usd = sol_balance * sol_price
-        for token_info in balances:
-            token_price = get_latest_close_price_in_sol(token_info.get("mint")) * sol_price
-            token_balance = float(token_info.get("amount", 0))
-            total_usd += token_balance * token_price
+class LeaderboardProgress:
+    """Edits the "being tallied" placeholder with partial standings, at most once per interval."""
 
-        pnl_usd = total_usd - start_usd_value
+    def __init__(self, message):
+        self.message = message
+        self.last_edit = time.monotonic()
+        self.last_text = message.text
 
-        results.append({
-            "username": user_name,
-            "wallet_address": wallet_address,
-            "net_worth_usd": total_usd,
-            "pnl_usd": pnl_usd
-        })
+    async def update(self, top: list, done: int, total: int, failed: list) -> None:
+        await self.report(format_leaderboard(top, f"Tallying… {done}/{total} wallets", failed), done, total)
 
-    results.sort(key=lambda x: x["pnl_usd"], reverse=True)
+    async def report(self, text: str, done: int, total: int) -> None:
+        if done < total and time.monotonic() - self.last_edit < LEADERBOARD_EDIT_INTERVAL:
+            return
+        await self._edit(text)
+
+    async def finish(self, text: str) -> None:
+        if not await self._edit(text):
+            await self.message.reply_text(text, parse_mode="Markdown")
+
+    async def _edit(self, text: str) -> bool:
+        if text == self.last_text:
+            return True
+        self.last_edit = time.monotonic()
+        try:
+            await self.message.edit_text(text, parse_mode="Markdown")
+        except TelegramError as e:
+            logger.warning(f"Could not update leaderboard message: {e}")
+            return False
+        self.last_text = text
+        return True
+
+@instrumented_handler
+async def sniper_leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /sniper_leaderboard - Latest standings snapshot.
+    /sniper_leaderboard refresh - Recompute now (group admins only).
+    """
+    chat_id = update.effective_chat.id
+    force_refresh = bool(context.args) and context.args[0].lower() == "refresh"
+    if force_refresh and not await is_chat_admin(update, context):
+        await update.message.reply_text("❌ Only group admins can force a leaderboard refresh.")
+        return
 
-    result_text = "🏆 *Sniper Bowl Leaderboard:* 🏆\n\n"
-    for rank, item in enumerate(results[:10], start=1):
-        sign = "+" if item["pnl_usd"] >= 0 else "-"
-        abs_pnl = abs(item["pnl_usd"])
-        result_text += (
-            f"{rank}. {item['username']} (Wallet: `{item['wallet_address']}`)\n"
-            f"   Net Worth: ${item['net_worth_usd']:.2f}\n"
-            f"   PnL: {sign}${abs_pnl:,.2f}\n\n"
+    snapshot = None if force_refresh else await latest_leaderboard_snapshot(chat_id)
+    if snapshot is None and VALUATION_MODE == "queue":
+        if not await wallets_collection.find_one({"chat_id": chat_id}, {"_id": 1}):
+            await update.message.reply_text("No wallets here. Use /register_wallet <address> to join!")
+            return
+        placeholder = await update.message.reply_text("🎯 Oh, you think you a Sniper Bowl All Star. Okay, your results are being tallied and will be posted to you shortly.")
+        await enqueue_job(
+            "leaderboard", chat_id, f"leaderboard:{chat_id}", PRIORITY_INTERACTIVE,
+            notify={"chat_id": chat_id, "message_id": placeholder.message_id},
         )
+        return
+    if snapshot is None:
+        sol_price = await current_sol_price()
+        if sol_price <= 0:
+            await update.message.reply_text("❌ Could not fetch SOL price. Leaderboard unavailable.")
+            return
+
+        all_wallets = await find_chat_wallets(chat_id)
+        if not all_wallets:
+            await update.message.reply_text("No wallets here. Use /register_wallet <address> to join!")
+            return
+
+        placeholder = await update.message.reply_text("🎯 Oh, you think you a Sniper Bowl All Star. Okay, your results are being tallied and will be posted to you shortly.")
+        progress = LeaderboardProgress(placeholder)
+        snapshot = await refresh_chat_leaderboard(chat_id, all_wallets, sol_price, progress.update)
+        await progress.finish(format_leaderboard(
+            snapshot["standings"], f"Updated {format_age(snapshot['computed_at'])}", snapshot["failed_wallets"]
+        ))
+        return
+
+    await update.message.reply_text(
+        format_leaderboard(snapshot["standings"], f"Updated {format_age(snapshot['computed_at'])}", snapshot.get("failed_wallets")),
+        parse_mode="Markdown"
+    )
+
+@instrumented_handler
+async def leaderboard_at_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/leaderboard_at <when> - Sniper Bowl standings as recorded at a past time."""
+    at = parse_past_time(" ".join(context.args)) if context.args else None
+    if at is None:
+        await update.message.reply_text("Usage: /leaderboard_at <when>, e.g. 3h, 2d, 12:00 or 2026-01-31T12:00 (UTC)")
+        return
+    standings = await leaderboard_at(update.effective_chat.id, at)
+    if not standings:
+        await update.message.reply_text("No leaderboard was recorded around that time.")
+        return
+    await update.message.reply_text(
+        format_leaderboard(standings, f"As of {at:%Y-%m-%d %H:%M} UTC"),
+        parse_mode="Markdown"
+    )
 
-    await update.message.reply_text(result_text, parse_mode="Markdown")
+@instrumented_handler
+async def global_leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/global_leaderboard - Top pickers and wallets across every chat."""
+    sol_price = await current_sol_price()
+    if sol_price <= 0:
+        await update.message.reply_text("❌ Could not fetch SOL price. Leaderboard unavailable.")
+        return
+    try:
+        board = await get_global_leaderboard(sol_price)
+    except Exception as e:
+        logger.error(f"Error computing global leaderboard: {e!r}")
+        await update.message.reply_text("❌ Could not compute the global leaderboard. Try again later.")
+        return
+    await update.message.reply_text(format_global_leaderboard(board), parse_mode="Markdown")
+
+async def _post_to(bot, target: dict, text: str) -> None:
+    """Edit the placeholder a job result belongs to, or post anew if that fails."""
+    try:
+        await bot.edit_message_text(text, chat_id=target["chat_id"], message_id=target["message_id"], parse_mode="Markdown")
+    except TelegramError as e:
+        logger.warning(f"Could not edit job message, sending instead: {e}")
+        await bot.send_message(target["chat_id"], text, parse_mode="Markdown")
+
+async def render_job_result(job: dict) -> str:
+    if job["status"] == "failed":
+        if job["kind"] == "register":
+            return "❌ Could not register wallet. Please try again later."
+        return "❌ Could not compute the leaderboard. Try again later."
+    if job["kind"] == "register":
+        return REGISTER_REPLIES[job["result"]["outcome"]]
+    snapshot = await snapshots_collection.find_one(
+        {"_id": job["result"]["snapshot_id"]},
+        {"computed_at": 1, "failed_wallets": 1, "standings": {"$slice": LEADERBOARD_SIZE}},
+    )
+    return format_leaderboard(snapshot["standings"], f"Updated {format_age(snapshot['computed_at'])}", snapshot["failed_wallets"])
+
+async def deliver_job_results_job(context: ContextTypes.DEFAULT_TYPE):
+    """Post worker progress and results (queue mode) to the messages waiting for them."""
+    async for job in jobs_collection.find({"status": "running", "progress_posted": False, "notify": {"$ne": []}}):
+        await jobs_collection.update_one({"_id": job["_id"]}, {"$set": {"progress_posted": True}})
+        progress = job["progress"]
+        text = format_leaderboard(progress["top"], f"Tallying… {progress['done']}/{progress['total']} wallets", progress["failed"])
+        for target in job["notify"]:
+            with contextlib.suppress(TelegramError):
+                await context.bot.edit_message_text(text, chat_id=target["chat_id"], message_id=target["message_id"], parse_mode="Markdown")
+
+    while True:
+        # Claim each finished job before posting so a result is delivered once
+        job = await jobs_collection.find_one_and_update(
+            {"status": {"$in": ["done", "failed"]}, "delivered": False},
+            {"$set": {"delivered": True}},
+        )
+        if job is None:
+            return
+        if not job["notify"]:
+            continue
+        try:
+            text = await render_job_result(job)
+            for target in job["notify"]:
+                await _post_to(context.bot, target, text)
+        except Exception as e:
+            logger.error(f"Could not deliver {job['kind']} job {job['_id']}: {e!r}")
 
 # ------------ /share ------------
+@instrumented_handler
 async def share_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     username = update.effective_user.username or "Anonymous"
 
-    user_picks = list(picks_collection.find({"chat_id": chat_id, "user_id": user_id}))
+    user_picks = await find_user_picks(chat_id, user_id)
     if not user_picks:
         await update.message.reply_text("No CA picks found for you here. Paste a CA first!")
         return
 
-    sol_price = get_sol_price()
+    sol_price = await current_sol_price()
     if sol_price <= 0:
         await update.message.reply_text("Error fetching SOL price. Try again later.")
         return
 
+    mints = [p["mint_address"] for p in user_picks]
+    metadata, prices = await asyncio.gather(get_token_metadata_many(mints), get_prices_in_sol(mints))
+
     lines = []
     total_pnl = 0.0
 
@@ -399,9 +2997,9 @@ async def share_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         mint = pick["mint_address"]
         cost_basis_usd = pick["cost_basis_usd"]
         num_tokens = pick["num_tokens"]
-        tiker=get_tiker(mint)
+        tiker=ticker_of(metadata.get(mint))
 
-        current_close_sol = get_latest_close_price_in_sol(mint)
+        current_close_sol = prices[mint]
         current_price_usd = current_close_sol * sol_price
         current_value_usd = num_tokens * current_price_usd
         pnl = current_value_usd - cost_basis_usd
@@ -431,9 +3029,15 @@ async def share_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     #print("tweet:",encoded_tweet);
 
 # ------------ Catch CA or fallback ------------
+MAX_CA_MESSAGE_LENGTH = 64  # 44-char address plus some surrounding whitespace
+
+@instrumented_handler
 async def handle_contract_address(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
         return
+    # Nearly every message here is ordinary chat; reject it before stripping or parsing
+    if not 32 <= len(update.message.text) <= MAX_CA_MESSAGE_LENGTH:
+        return
     text = update.message.text.strip()
     if not is_valid_solana_address(text):
         # await fallback_echo(update, context)
@@ -444,24 +3048,29 @@ async def handle_contract_address(update: Update, context: ContextTypes.DEFAULT_
     username = update.effective_user.username or "Anonymous"
     mint_address = text
 
-    existing_pick = picks_collection.find_one({"chat_id": chat_id, "mint_address": mint_address})
-    if existing_pick:
+    if await is_already_shilled(chat_id, mint_address):
         await update.message.reply_text(f"🎯 This CA was already shilled here: {mint_address}")
         return
 
-    sol_price = get_sol_price()
+    sol_price = await current_sol_price()
     if sol_price <= 0:
         await update.message.reply_text("Error: Could not fetch SOL price. Try again later.")
         return
 
     try:
-        close_price_sol = get_latest_close_price_in_sol(mint_address)
-        if close_price_sol <= 0:
-            await update.message.reply_text(f"❌ Could not fetch price for this token. It might be too new or invalid.")
-            return
+        price_quote = await get_price_quote(mint_address)
     except Exception as e:
         await update.message.reply_text(f"❌ Could not fetch price for this token. It might be too new or invalid.")
         return
+    if price_quote.source == "stale" or price_quote.age > 0:
+        # A last-known price is fine for valuations but would let a pick lock in
+        # whatever the token did since, so the entry price must be live
+        await update.message.reply_text("⏳ Price providers are unavailable right now, so this pick can't be booked. Try again in a few minutes.")
+        return
+    close_price_sol = price_quote.price
+    if close_price_sol <= 0:
+        await update.message.reply_text(f"❌ Could not fetch price for this token. It might be too new or invalid.")
+        return
 
     cost_basis_usd = 0.5 * sol_price
     num_tokens = 0.5 / close_price_sol
@@ -476,7 +3085,12 @@ async def handle_contract_address(update: Update, context: ContextTypes.DEFAULT_
         "created_at": datetime.now(UTC)
     }
     try:
-        picks_collection.insert_one(pick_doc)
+        await picks_collection.insert_one(pick_doc)
+        shilled_mints[chat_id].add(mint_address)
+    except DuplicateKeyError:
+        shilled_mints[chat_id].add(mint_address)
+        await update.message.reply_text(f"🎯 This CA was already shilled here: {mint_address}")
+        return
     except Exception as e:
         logger.error(f"Error inserting pick: {e}")
         await update.message.reply_text("❌ Could not add your pick. Possibly a duplicate or DB error.")
@@ -494,26 +3108,217 @@ async def handle_contract_address(update: Update, context: ContextTypes.DEFAULT_
 #     await update.message.reply_text(f"You said: {update.message.text}")
 
 # ==========================================
-# 6. Main
+# 11. Main
 # ==========================================
-def main():
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
-
-    # Set up command descriptions
-    commands = [
-        ("start", "Start the bot and get welcome message"),
-        ("help", "Show help message with all commands"),
-        ("rules", "Show rules of usage Sniper Bowl"),
-        ("my_calls", "Show shilled CA leaderboard"),
-        ("register_wallet", "Register wallet for Sniper Bowl"),
-        ("sniper_leaderboard", "Show Sniper Bowl leaderboard"),
-        ("share", "Share your picks on Twitter")
-    ]
-    
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" or "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")        # public https base URL Telegram posts to, webhook mode only
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # checked against X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+PORT = int(os.getenv("PORT", "8443"))         # webhook listener; PaaS platforms set this
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))  # 1 = one update at a time
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently (up to the limit) but
+    those from one chat strictly in arrival order, so ConversationHandler
+    state such as /register_wallet never races. A chat with a backlog drains
+    it within the one slot it already holds instead of tying up more.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._backlogs: dict = {}  # chat_id -> coroutines queued behind the running update
+
+    async def do_process_update(self, update, coroutine) -> None:
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await coroutine
+            return
+        backlog = self._backlogs.get(chat.id)
+        if backlog is not None:
+            backlog.append(coroutine)  # the chat's running update picks it up next
+            return
+        backlog = self._backlogs[chat.id] = deque([coroutine])
+        try:
+            while backlog:
+                try:
+                    await backlog.popleft()
+                except Exception as e:
+                    logger.error(f"Unhandled error processing an update for chat {chat.id}: {e!r}")
+        finally:
+            del self._backlogs[chat.id]
+            for pending in backlog:
+                pending.close()  # only left over if we were cancelled
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+BOT_COMMANDS = [
+    ("start", "Start the bot and get welcome message"),
+    ("help", "Show help message with all commands"),
+    ("rules", "Show rules of usage Sniper Bowl"),
+    ("my_calls", "Show shilled CA leaderboard"),
+    ("register_wallet", "Register wallet for Sniper Bowl"),
+    ("sniper_leaderboard", "Show Sniper Bowl leaderboard"),
+    ("leaderboard_at", "Show the Sniper Bowl leaderboard at a past time"),
+    ("global_leaderboard", "Show top pickers and wallets across all groups"),
+    ("bulk_register", "Register many wallets from a CSV (admins)"),
+    ("share", "Share your picks on Twitter")
+]
+
+TOKEN_METADATA_WARM_SIZE = int(os.getenv("TOKEN_METADATA_WARM_SIZE", "2000"))  # recently picked mints preloaded
+
+metrics.describe("sniperbowl_startup_seconds", "gauge", "Seconds from process start until warm-up finished.")
+
+class WarmUp:
+    """
+    Runs the startup steps (index setup, cache warm-up, ...) concurrently in
+    the background, so the bot answers updates while they are still going.
+    Handlers cope with cold caches; /readyz reports when everything is done.
+    """
+
+    def __init__(self):
+        self.pending: set = set()
+        self.failed: dict = {}  # step -> error
+        self._tasks: list = []
+
+    def start(self, steps: dict) -> None:
+        self.pending = set(steps)
+        self._tasks = [asyncio.create_task(self._run(name, step)) for name, step in steps.items()]
+
+    async def _run(self, name: str, step) -> None:
+        started = time.monotonic()
+        try:
+            await step
+        except Exception as e:
+            self.failed[name] = repr(e)
+            logger.error(f"Startup step {name} failed: {e!r}")
+        else:
+            logger.info(f"Startup step {name} done in {(time.monotonic() - started) * 1000:.0f}ms")
+        finally:
+            self.pending.discard(name)
+            if not self.pending:
+                metrics.set("sniperbowl_startup_seconds", time.monotonic() - PROCESS_STARTED)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+warm_up = WarmUp()
+
+async def warm_token_metadata() -> None:
+    """Preload stored metadata for recently picked mints; Mongo only, no Moralis calls."""
+    cursor = picks_collection.find({}, {"_id": 0, "mint_address": 1}).sort("created_at", -1).limit(TOKEN_METADATA_WARM_SIZE)
+    mints = list(dict.fromkeys([doc["mint_address"] async for doc in cursor]))
+    async for doc in metadata_collection.find({"_id": {"$in": mints}}):
+        token_metadata_cache.set(doc["_id"], doc)
+
+async def health_route():
+    """Liveness: the event loop is answering."""
+    return 200, "application/json", json.dumps({"status": "ok", "uptime": round(time.monotonic() - PROCESS_STARTED, 1)})
+
+READY_PING_TIMEOUT = 1.0  # seconds /readyz waits for MongoDB
+
+async def ready_route():
+    """
+    Readiness: warm-up finished, a SOL price is on hand and MongoDB answers a
+    ping. Failed warm-up steps are listed but do not block; their caches fill
+    on demand.
+    """
+    try:
+        await asyncio.wait_for(db.command("ping"), READY_PING_TIMEOUT)
+        mongo = True
+    except Exception:
+        mongo = False
+    ready = not warm_up.pending and sol_ticker.current() > 0 and mongo
+    body = {"ready": ready, "mongo": mongo, "pending": sorted(warm_up.pending), "failed": warm_up.failed}
+    return (200 if ready else 503), "application/json", json.dumps(body)
+
+HTTP_ROUTES = {"/metrics": metrics_route, "/healthz": health_route, "/readyz": ready_route}
+
+async def on_startup(app):
+    if METRICS_PORT:
+        app.bot_data["metrics_server"] = await start_http_endpoint(METRICS_HOST, METRICS_PORT, HTTP_ROUTES)
+    warm_up.start({
+        "indexes": ensure_indexes(),
+        "sol_price": sol_ticker.refresh(),
+        "shilled_mints": load_shilled_mints(),
+        "token_metadata": warm_token_metadata(),
+        "bot_commands": app.bot.set_my_commands(BOT_COMMANDS),
+    })
+    if SOLANA_WS_URL:
+        app.bot_data["wallet_tracker"] = asyncio.create_task(
+            WalletTracker(SOLANA_WS_URL, WALLET_TRACKER_HEARTBEAT).run()
+        )
+
+async def on_shutdown(app):
+    await warm_up.stop()
+    tracker = app.bot_data.pop("wallet_tracker", None)
+    if tracker is not None:
+        tracker.cancel()
+    server = app.bot_data.pop("metrics_server", None)
+    if server is not None:
+        server.close()
+    await history_buffer.flush()
+    await close_http_client()
+    close_mongo_client()
+
+async def worker_main():
+    """Entry point of `python bot.py worker`: process valuation jobs until stopped."""
+    check_settings("MONGODB_URI", "API_KEY")
+    check_price_providers()
+    if METRICS_PORT:
+        await start_http_endpoint(METRICS_HOST, METRICS_PORT, HTTP_ROUTES)
+    warm_up.start({"indexes": ensure_indexes(), "sol_price": sol_ticker.refresh()})
+
+    async def keep_sol_price_fresh():
+        while True:
+            await asyncio.sleep(SOL_PRICE_REFRESH_INTERVAL)
+            await sol_ticker.refresh()
+
+    ticker = asyncio.create_task(keep_sol_price_fresh())
+    worker = asyncio.create_task(run_worker())
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, worker.cancel)  # dyno restarts
+    try:
+        await worker
+    except asyncio.CancelledError:
+        logger.info("Valuation worker stopped")
+    finally:
+        ticker.cancel()
+        await warm_up.stop()
+        await history_buffer.flush()
+        await close_http_client()
+        close_mongo_client()
+
+def create_app():
+    """
+    Build the Telegram application with its handlers and jobs. Nothing here
+    touches MongoDB or the network; connections open on first use and the
+    warm-up runs in the background once the application starts.
+    """
+    check_settings("TELEGRAM_BOT_TOKEN", "MONGODB_URI", "API_KEY")
+    check_price_providers()
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(InstrumentedRequest())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if MAX_CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    app = builder.build()
+
     # Commands
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("rules", rule_command))
+    # Handlers block their update: ChatOrderedUpdateProcessor already runs chats
+    # side by side, bounds them at MAX_CONCURRENT_UPDATES and keeps each chat in order
     app.add_handler(CommandHandler("my_calls", leader_command))
     
     # Add conversation handler for wallet registration
@@ -528,15 +3333,58 @@ def main():
     
     app.add_handler(CommandHandler("sniper_leaderboard", sniper_leaderboard_command))
     app.add_handler(CommandHandler("share", share_command))
+    app.add_handler(CommandHandler("leaderboard_at", leaderboard_at_command))
+    app.add_handler(CommandHandler("global_leaderboard", global_leaderboard_command))
+    app.add_handler(CommandHandler("bulk_register", bulk_register_command))
+    app.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/bulk_register(@\w+)?\b"), bulk_register_command
+    ))
+
+    # Keep the SOL/USD quote warm so handlers never wait on CoinGecko (the warm-up fetches the first one)
+    app.job_queue.run_repeating(refresh_sol_price_job, interval=SOL_PRICE_REFRESH_INTERVAL, first=SOL_PRICE_REFRESH_INTERVAL)
+
+    app.job_queue.run_repeating(
+        refresh_leaderboard_snapshots_job,
+        interval=LEADERBOARD_REFRESH_INTERVAL,
+        first=LEADERBOARD_REFRESH_INTERVAL,
+    )
+
+    app.job_queue.run_repeating(roll_up_history_job, interval=HISTORY_ROLLUP_INTERVAL, first=60)
+
+    # Keep latest_prices current for picked mints the global leaderboard reads
+    app.job_queue.run_repeating(refresh_pick_prices_job, interval=PICK_PRICE_REFRESH_INTERVAL, first=120)
+
+    if VALUATION_MODE == "queue":
+        app.job_queue.run_repeating(deliver_job_results_job, interval=JOB_POLL_INTERVAL, first=JOB_POLL_INTERVAL)
 
     # Handle text -> either valid CA or fallback
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_contract_address))
+    return app
 
+def main():
+    configure_logging()
+    if sys.argv[1:] == ["worker"]:
+        asyncio.run(worker_main())
+        return
+
+    app = create_app()
     logger.info("Starting Snipe Checks Bot with MongoDB persistence...")
-    
-    # Set commands and start polling
-    app.bot.set_my_commands(commands)
-    app.run_polling()
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET must be set when BOT_MODE=webhook")
+        if "PORT" not in os.environ:
+            # Heroku only sets PORT (and routes traffic) for web dynos
+            logger.warning(f"PORT is not set; listening on {PORT}. Webhook mode needs a web process on Heroku")
+        # PTB's embedded server answers 403 to requests without the matching secret token header
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        app.run_polling()
 
 
 if __name__ == "__main__":
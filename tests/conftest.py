@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench  # noqa: E402
+import bot  # noqa: E402
+
+
+@pytest.fixture
+def fake_mongo(monkeypatch):
+    """bench's in-memory collections in place of Mongo, put back after the test."""
+    for attr in ("picks_collection", "wallets_collection", "snapshots_collection", "metadata_collection",
+                 "holdings_collection", "jobs_collection", "denylist_collection", "price_history_collection",
+                 "networth_history_collection", "latest_prices_collection"):
+        monkeypatch.setattr(bot, attr, getattr(bot, attr))
+    return bench.install_fake_mongo()
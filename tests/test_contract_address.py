@@ -0,0 +1,44 @@
+"""Booking a pick from a pasted contract address."""
+import asyncio
+import time
+
+import pytest
+
+import bench
+import bot
+from test_price_oracle import StubProvider
+
+MINT = bench.new_address()
+
+
+@pytest.fixture(autouse=True)
+def live_sol_price(fake_mongo, monkeypatch):
+    async def sol_price():
+        return 150.0
+
+    monkeypatch.setattr(bot, "current_sol_price", sol_price)
+    monkeypatch.setattr(bot, "record_price_sample", lambda series, price: None)
+    monkeypatch.setattr(bot, "price_cache", bot.TTLCache(10, 60, ttl_for=bot._price_ttl))
+    monkeypatch.setattr(bot, "shilled_mints", bot.defaultdict(set))
+
+
+def paste(oracle, monkeypatch) -> str:
+    monkeypatch.setattr(bot, "price_oracle", oracle)
+    update = bench.make_update(7, "shiller", MINT)
+    asyncio.run(bot.handle_contract_address(update, bench.make_context()))
+    return update.message.replies[-1].text
+
+
+def test_live_price_books_the_pick(fake_mongo, monkeypatch):
+    oracle = bot.PriceOracle([StubProvider("primary", {MINT: 0.001})])
+
+    assert paste(oracle, monkeypatch).startswith("✅")
+    assert fake_mongo["picks_collection"].docs[0]["num_tokens"] == pytest.approx(500)
+
+
+def test_stale_price_is_not_used_as_an_entry_price(fake_mongo, monkeypatch):
+    oracle = bot.PriceOracle([StubProvider("primary", fail=True)])
+    oracle.last_known.set(MINT, (0.001, time.time() - 3000))  # the token may have pumped since
+
+    assert paste(oracle, monkeypatch).startswith("⏳")
+    assert fake_mongo["picks_collection"].docs == []
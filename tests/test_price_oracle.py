@@ -0,0 +1,151 @@
+"""PriceOracle hedging, failover, circuit breakers and stale fallback against in-process stub providers."""
+import asyncio
+import time
+
+import pytest
+
+import bot
+
+
+class StubProvider(bot.PriceProvider):
+    def __init__(self, name: str, prices: dict | None = None, delay: float = 0.0, fail: bool = False):
+        self.name = name
+        self.prices = prices or {}
+        self.delay = delay
+        self.fail = fail
+        self.calls: list = []
+
+    async def fetch_prices(self, mint_addresses: list) -> dict:
+        self.calls.append(list(mint_addresses))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return {m: self.prices[m] for m in mint_addresses if m in self.prices}
+
+
+@pytest.fixture(autouse=True)
+def quiet_oracle(monkeypatch):
+    monkeypatch.setattr(bot, "record_price_sample", lambda series, price: None)
+    monkeypatch.setattr(bot, "PRICE_HEDGE_DEFAULT_DELAY", 0.05)
+    monkeypatch.setattr(bot, "PRICE_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(bot, "PRICE_BREAKER_RESET", 0.1)
+
+
+def fetch(oracle, mints):
+    return asyncio.run(oracle.fetch_quotes(mints))
+
+
+def test_slow_primary_is_hedged_by_secondary():
+    primary = StubProvider("primary", {"a": 1.0}, delay=1.0)
+    secondary = StubProvider("secondary", {"a": 2.0})
+    oracle = bot.PriceOracle([primary, secondary])
+
+    started = time.monotonic()
+    quotes = fetch(oracle, ["a"])
+
+    assert quotes["a"] == bot.PriceQuote(2.0, 0.0, "secondary")
+    assert time.monotonic() - started < 0.5  # did not wait for the primary
+    assert secondary.calls == [["a"]]
+    assert not oracle.breakers["primary"].is_open  # losing the race is not a failure
+
+
+def test_partial_answer_falls_through_for_the_rest():
+    primary = StubProvider("primary", {"a": 1.0})
+    secondary = StubProvider("secondary", {"a": 5.0, "b": 2.0})
+    oracle = bot.PriceOracle([primary, secondary])
+
+    quotes = fetch(oracle, ["a", "b"])
+
+    assert quotes["a"].source == "primary"
+    assert quotes["b"] == bot.PriceQuote(2.0, 0.0, "secondary")
+    assert secondary.calls == [["b"]]  # only the mints still missing
+
+
+def test_breaker_opens_after_repeated_failures():
+    primary = StubProvider("primary", fail=True)
+    secondary = StubProvider("secondary", {"a": 2.0})
+    oracle = bot.PriceOracle([primary, secondary])
+
+    fetch(oracle, ["a"])
+    fetch(oracle, ["a"])
+    assert oracle.breakers["primary"].is_open
+
+    quotes = fetch(oracle, ["a"])
+    assert quotes["a"].source == "secondary"
+    assert len(primary.calls) == 2  # skipped while open
+
+
+def test_open_breaker_lets_one_trial_through_after_cooldown():
+    primary = StubProvider("primary", {"a": 1.0}, fail=True)
+    oracle = bot.PriceOracle([primary])
+    fetch(oracle, ["a"])
+    fetch(oracle, ["a"])
+    breaker = oracle.breakers["primary"]
+    assert breaker.is_open
+
+    time.sleep(0.15)
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial while half-open
+    breaker.record_abandoned()
+
+    primary.fail = False
+    quotes = fetch(oracle, ["a"])
+    assert quotes["a"].source == "primary"
+    assert not breaker.is_open
+
+
+def test_unstarted_provider_does_not_hold_a_half_open_trial():
+    primary = StubProvider("primary", {"a": 1.0}, fail=True)
+    secondary = StubProvider("secondary", {"a": 2.0}, fail=True)
+    oracle = bot.PriceOracle([primary, secondary])
+    fetch(oracle, ["a"])
+    fetch(oracle, ["a"])
+    assert oracle.breakers["primary"].is_open and oracle.breakers["secondary"].is_open
+
+    time.sleep(0.15)
+    primary.fail = False
+    fetch(oracle, ["a"])  # the primary answers; the secondary is never started
+    assert not oracle.breakers["secondary"]._trial_running
+
+    primary.fail, secondary.fail = True, False
+    time.sleep(0.15)
+    quotes = fetch(oracle, ["a"])
+    assert quotes["a"].source == "secondary"
+
+
+def test_all_down_serves_last_known_price_with_age():
+    primary = StubProvider("primary", {"a": 1.5})
+    oracle = bot.PriceOracle([primary])
+    fetch(oracle, ["a"])
+
+    primary.fail = True
+    time.sleep(0.05)
+    quotes = fetch(oracle, ["a", "never-seen"])
+
+    assert quotes["a"].price == 1.5
+    assert quotes["a"].source == "stale"
+    assert quotes["a"].age >= 0.05
+    assert "never-seen" not in quotes  # no answer at all is not the same as unpriced
+
+
+def test_unpriced_only_when_every_provider_answered():
+    primary = StubProvider("primary", {"a": 1.0})
+    secondary = StubProvider("secondary", fail=True)
+    oracle = bot.PriceOracle([primary, secondary])
+
+    quotes = fetch(oracle, ["a", "b"])
+    assert "b" not in quotes  # the secondary never answered, so b may still have a price
+
+    secondary.fail = False
+    quotes = fetch(oracle, ["a", "b"])
+    assert quotes["b"] is bot.UNPRICED
+
+
+def test_cancelled_hedge_is_not_counted_as_an_error():
+    primary = StubProvider("hedged-primary", {"a": 1.0}, delay=1.0)
+    secondary = StubProvider("hedged-secondary", {"a": 2.0})
+    fetch(bot.PriceOracle([primary, secondary]), ["a"])
+
+    errors = [line for line in bot.metrics.render().splitlines()
+              if line.startswith("sniperbowl_call_errors_total{") and "hedged-primary" in line]
+    assert errors == []
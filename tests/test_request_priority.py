@@ -0,0 +1,87 @@
+"""Shared fetches and leaderboard refreshes never make an interactive caller wait at background priority."""
+import asyncio
+
+import bot
+
+
+async def as_priority(priority, coro):
+    bot.request_priority.set(priority)  # gather() runs each coroutine in its own task and context
+    return await coro
+
+
+def test_interactive_miss_does_not_join_a_background_fetch():
+    async def scenario():
+        cache = bot.TTLCache(10, 60)
+        release = asyncio.Event()
+        seen = []
+
+        async def fetch(key):
+            seen.append(bot.request_priority.get())
+            await release.wait()
+            return key.upper()
+
+        background = asyncio.ensure_future(as_priority(bot.PRIORITY_BACKGROUND, cache.get_or_fetch("a", fetch)))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(as_priority(bot.PRIORITY_INTERACTIVE, cache.get_or_fetch("a", fetch)))
+        await asyncio.sleep(0)
+        late = asyncio.ensure_future(as_priority(bot.PRIORITY_BACKGROUND, cache.get_or_fetch("a", fetch)))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(background, interactive, late) == ["A", "A", "A"]
+        assert seen == [bot.PRIORITY_BACKGROUND, bot.PRIORITY_INTERACTIVE]
+        assert cache.coalesced == 1  # the late background caller rode along with the interactive fetch
+
+    asyncio.run(scenario())
+
+
+def test_batches_run_at_the_priority_of_their_callers():
+    async def scenario():
+        batches = []
+
+        async def fetch_many(keys):
+            batches.append((bot.request_priority.get(), sorted(keys)))
+            return {k: k.upper() for k in keys}
+
+        batcher = bot.MicroBatcher(fetch_many, window=0.01, max_size=100)
+        results = await asyncio.gather(
+            as_priority(bot.PRIORITY_BACKGROUND, batcher.fetch(["a"])),
+            as_priority(bot.PRIORITY_INTERACTIVE, batcher.fetch(["b"])),
+            as_priority(bot.PRIORITY_BACKGROUND, batcher.fetch(["c"])),
+        )
+
+        assert all(results)
+        assert sorted(batches) == [
+            (bot.PRIORITY_INTERACTIVE, ["b", "c"]),  # background keys may join an interactive batch
+            (bot.PRIORITY_BACKGROUND, ["a"]),
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_interactive_leaderboard_refresh_does_not_join_a_background_one(monkeypatch):
+    async def scenario():
+        release = asyncio.Event()
+        builds = []
+
+        async def build(chat_id, all_wallets, sol_price, on_progress=None):
+            builds.append((bot.request_priority.get(), on_progress))
+            await release.wait()
+            return {"chat_id": chat_id}
+
+        monkeypatch.setattr(bot, "build_leaderboard_snapshot", build)
+        progress = object()
+        refreshes = []
+        for priority, on_progress in ((bot.PRIORITY_BACKGROUND, None), (bot.PRIORITY_INTERACTIVE, progress),
+                                      (bot.PRIORITY_BACKGROUND, None)):
+            refreshes.append(asyncio.ensure_future(
+                as_priority(priority, bot.refresh_chat_leaderboard(1, [], 150.0, on_progress))
+            ))
+            await asyncio.sleep(0)
+        release.set()
+
+        assert await asyncio.gather(*refreshes) == [{"chat_id": 1}] * 3
+        assert builds == [(bot.PRIORITY_BACKGROUND, None), (bot.PRIORITY_INTERACTIVE, progress)]
+        assert bot._leaderboard_refreshes == {}
+
+    asyncio.run(scenario())
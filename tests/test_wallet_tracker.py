@@ -0,0 +1,169 @@
+"""WalletTracker against bench's websocket stand-in for a Solana RPC node and its in-memory Mongo."""
+import asyncio
+import contextlib
+from datetime import UTC, datetime
+
+import pytest
+
+import bench
+import bot
+
+WALLET = bench.new_address()
+
+
+@pytest.fixture(autouse=True)
+def fake_world(fake_mongo, monkeypatch):
+    collections = fake_mongo
+    collections["wallets_collection"].docs = [{"_id": 1, "chat_id": bench.BENCH_CHAT_ID, "wallet_address": WALLET}]
+    monkeypatch.setattr(bot, "WALLET_TRACKER_FLUSH_INTERVAL", 0.05)
+    return collections
+
+
+class FakeChain:
+    """Stands in for the Moralis balance lookups and counts them."""
+
+    def __init__(self):
+        self.fetches = 0
+        self.during_fetch = None
+
+    async def sol_balance(self, wallet_address):
+        return 1.0
+
+    async def token_balances(self, wallet_address):
+        self.fetches += 1
+        if self.during_fetch:
+            await self.during_fetch()
+        return [{"mint": "m", "amount": "1", "possible_spam": False}]
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    chain = FakeChain()
+    monkeypatch.setattr(bot, "get_sol_balance", chain.sol_balance)
+    monkeypatch.setattr(bot, "get_wallet_balances", chain.token_balances)
+    return chain
+
+
+@contextlib.asynccontextmanager
+async def tracking(holdings, reject: dict | None = None, wait_live: bool = True):
+    rpc = bench.StubSolanaRpc()
+    rpc.reject.update(reject or {})
+    tracker = bot.WalletTracker(await rpc.start(), heartbeat=0.1)
+    task = asyncio.create_task(tracker.run())
+    try:
+        for _ in range(100 if wait_live else 0):
+            if WALLET in tracker.live_wallets and any(d.get("watched_until") for d in holdings.docs):
+                break
+            await asyncio.sleep(0.02)
+        else:
+            if wait_live:
+                raise AssertionError("tracker never went live")
+        yield rpc, tracker
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        await rpc.stop()
+
+
+def holdings_doc(collections):
+    return next(d for d in collections["holdings_collection"].docs if d["_id"] == WALLET)
+
+
+async def flushed():
+    await asyncio.sleep(bot.WALLET_TRACKER_FLUSH_INTERVAL * 3)
+
+
+def test_watched_holdings_are_served_until_a_notification_marks_them_dirty(fake_world, chain):
+    async def scenario():
+        async with tracking(fake_world["holdings_collection"]) as (rpc, tracker):
+            assert len(rpc.subscriptions[WALLET]) == len(bot.WALLET_SUBSCRIPTION_KINDS)
+            await bot.get_wallet_holdings(WALLET)
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 1
+            assert holdings_doc(fake_world)["dirty"] is False
+
+            await rpc.trade(WALLET)
+            await flushed()
+            assert holdings_doc(fake_world)["dirty"] is True
+
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 2
+
+    asyncio.run(scenario())
+
+
+def test_version_bump_mid_fetch_keeps_holdings_dirty(fake_world, chain):
+    async def scenario():
+        async with tracking(fake_world["holdings_collection"]) as (rpc, tracker):
+            async def trade_while_fetching():
+                await rpc.trade(WALLET)
+                await flushed()
+
+            chain.during_fetch = trade_while_fetching
+            await bot.get_wallet_holdings(WALLET)
+            assert holdings_doc(fake_world)["dirty"] is True
+
+            chain.during_fetch = None
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 2
+            assert holdings_doc(fake_world)["dirty"] is False
+
+    asyncio.run(scenario())
+
+
+def test_lapsed_lease_makes_the_next_valuation_fetch_again(fake_world, chain):
+    async def scenario():
+        async with tracking(fake_world["holdings_collection"]) as (rpc, tracker):
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 1
+
+            async def wedged():
+                pass
+
+            tracker._renew = wedged  # still connected, but no longer vouching
+            lease = holdings_doc(fake_world)["watched_until"]
+            await asyncio.sleep((lease - datetime.now(UTC)).total_seconds() + 0.05)
+            assert holdings_doc(fake_world)["dirty"] is False
+
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 2
+
+    asyncio.run(scenario())
+
+
+def test_old_clean_holdings_are_fetched_again(fake_world, chain, monkeypatch):
+    async def scenario():
+        async with tracking(fake_world["holdings_collection"]):
+            await bot.get_wallet_holdings(WALLET)
+            monkeypatch.setattr(bot, "HOLDINGS_MAX_AGE", 0)
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 2
+
+    asyncio.run(scenario())
+
+
+def test_rejected_token_subscription_keeps_the_wallet_unwatched(fake_world, chain):
+    async def scenario():
+        holdings = fake_world["holdings_collection"]
+        async with tracking(holdings, reject={"programSubscribe": 10**6}, wait_live=False) as (rpc, tracker):
+            await asyncio.sleep(0.5)  # several heartbeats of retries
+            assert WALLET not in tracker.live_wallets
+            assert tracker._confirmed[WALLET] == {"account", "logs"}
+            assert len(rpc.subscriptions[WALLET]) == 2  # confirmed kinds are not sent again
+            assert not any(d.get("watched_until") for d in holdings.docs)
+
+            await bot.get_wallet_holdings(WALLET)
+            await bot.get_wallet_holdings(WALLET)
+            assert chain.fetches == 2  # nothing vouches for the cached holdings
+
+    asyncio.run(scenario())
+
+
+def test_rejected_subscription_is_retried_on_its_own(fake_world, chain):
+    async def scenario():
+        async with tracking(fake_world["holdings_collection"], reject={"programSubscribe": 1}) as (rpc, tracker):
+            assert len(rpc.subscriptions[WALLET]) == len(bot.WALLET_SUBSCRIPTION_KINDS)
+            assert tracker._confirmed[WALLET] == set(bot.WALLET_SUBSCRIPTION_KINDS)
+
+    asyncio.run(scenario())